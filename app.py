@@ -9,8 +9,10 @@ from cache import init_cache
 # endpoints
 from endpoints.forecast import forecast_bp
 from endpoints.main import main_bp
+from endpoints.metrics import metrics_bp
 from endpoints.models import models_bp
 from endpoints.products import products_bp
+from services.metrics import init_metrics
 from services.tools import ensure_directory_exists_and_writable
 
 load_dotenv()
@@ -20,10 +22,12 @@ app = Flask(
 )
 app.secret_key = os.getenv("SECRET_KEY")
 init_cache(app)
+init_metrics(app)
 app.register_blueprint(forecast_bp)
 app.register_blueprint(products_bp)
 app.register_blueprint(main_bp)
 app.register_blueprint(models_bp)
+app.register_blueprint(metrics_bp)
 
 if __name__ == "__main__":
     ensure_directory_exists_and_writable(config.DATA_DIR)
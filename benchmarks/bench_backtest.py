@@ -0,0 +1,50 @@
+import argparse
+import os
+import tempfile
+
+import config
+from services.process_data.backtest import BACKTEST_SPECS, run_backtest
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Backtest forecasts of the stored data with every kind of models"
+    )
+    parser.add_argument("--workers", type=int, default=config.TRAINING_WORKERS)
+    parser.add_argument("--origins", type=int, default=config.BACKTEST_ORIGINS)
+    parser.add_argument("--step", type=int, default=config.BACKTEST_STEP)
+    parser.add_argument("--horizon", type=int, default=config.BACKTEST_HORIZON)
+    args = parser.parse_args()
+
+    if not os.path.isfile(config.DATA_COLUMNS_PATH):
+        parser.error("No stored data, create models first")
+
+    print(
+        f"{'models':<10} {'warm':<6} {'MAE':>8} {'RMSE':>8} {'MAPE %':>8} "
+        f"{'fits':>6} {'fit s':>8} {'iters':>8} {'wall s':>8}"
+    )
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for spec in BACKTEST_SPECS:
+            for warm_start in (False, True):
+                report = run_backtest(
+                    spec,
+                    horizon=args.horizon,
+                    origins=args.origins,
+                    step=args.step,
+                    warm_start=warm_start,
+                    max_workers=args.workers,
+                    report_path=os.path.join(tmp_dir, "backtest.json"),
+                )
+                metrics = report["aggregate"]
+                mape = "-" if metrics["mape"] is None else f"{metrics['mape']:.3f}"
+                print(
+                    f"{spec:<10} {str(warm_start):<6} {metrics['mae']:>8.4f} "
+                    f"{metrics['rmse']:>8.4f} {mape:>8} "
+                    f"{metrics['fits']:>6} {metrics['fit_seconds']:>8.2f} "
+                    f"{metrics['fit_iterations_per_fit']:>8.1f} "
+                    f"{report['elapsed']:>8.2f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
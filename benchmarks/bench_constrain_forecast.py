@@ -0,0 +1,79 @@
+import argparse
+import timeit
+
+import numpy as np
+import pandas as pd
+
+from services.forecast import constrain_forecast, constrain_forecasts
+
+
+def constrain_forecast_loop(original, forecast, max_change=0.05) -> list:
+    """
+    Previous pure Python implementation, kept as a reference.
+    """
+    constrained = [original.iloc[-1]]
+    for f in forecast:
+        change = (f - constrained[-1]) / constrained[-1]
+        if abs(change) > max_change:
+            new_value = constrained[-1] * (1 + max_change * np.sign(change))
+        else:
+            new_value = f
+        constrained.append(new_value)
+    return constrained[1:]
+
+
+def make_data(products: int, horizon: int, seed: int = 0):
+    """
+    Random walks of price indices with jumps large enough to trigger the limit.
+    """
+    rng = np.random.default_rng(seed)
+    last_values = rng.uniform(90, 110, products)
+    steps = rng.normal(0, 0.04, (products, horizon))
+    forecasts = last_values[:, None] * np.exp(np.cumsum(steps, axis=1))
+    return last_values, forecasts
+
+
+def check_equivalence(last_values: np.ndarray, forecasts: np.ndarray) -> None:
+    batch = constrain_forecasts(last_values, forecasts)
+    for i in range(len(last_values)):
+        original = pd.Series([last_values[i]])
+        expected = constrain_forecast_loop(original, forecasts[i])
+        assert constrain_forecast(original, forecasts[i]) == expected
+        assert batch[i].tolist() == expected
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark constrain_forecast")
+    parser.add_argument("--products", type=int, nargs="+", default=[1, 100, 1000])
+    parser.add_argument("--horizons", type=int, nargs="+", default=[28, 104, 520])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    check_equivalence(*make_data(200, 104))
+    print("Results are identical to the loop implementation")
+
+    print(
+        f"{'products':>8} {'horizon':>8} {'loop, ms':>10} {'batch, ms':>10} {'speedup':>8}"
+    )
+    for products in args.products:
+        for horizon in args.horizons:
+            last_values, forecasts = make_data(products, horizon)
+            originals = [pd.Series([value]) for value in last_values]
+
+            def loop():
+                for original, forecast in zip(originals, forecasts):
+                    constrain_forecast_loop(original, forecast)
+
+            def batch():
+                constrain_forecasts(last_values, forecasts)
+
+            loop_time = min(timeit.repeat(loop, number=1, repeat=args.repeat))
+            batch_time = min(timeit.repeat(batch, number=1, repeat=args.repeat))
+            print(
+                f"{products:>8} {horizon:>8} {loop_time * 1000:>10.2f} "
+                f"{batch_time * 1000:>10.2f} {loop_time / batch_time:>7.1f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from services.process_data.generate_models import group_by_product, split_data
+
+
+def split_data_masks(df: pd.DataFrame, split_coefficient: float = 0.15):
+    """
+    Previous implementation with a comparison per part, kept as a reference.
+    """
+    total_days = (df["Date"].max() - df["Date"].min()).days
+    split_date = df["Date"].min() + pd.DateOffset(
+        days=int(total_days * (1 - split_coefficient))
+    )
+    return df[df["Date"] <= split_date], df[df["Date"] > split_date]
+
+
+def filter_per_product(df: pd.DataFrame) -> dict[str, pd.DataFrame]:
+    """
+    Slicing done by make_forecast on full data: a filter over all rows per product.
+    """
+    return {
+        product: df[df["Product"] == product].sort_values(by="Date")
+        for product in df["Product"].unique()
+    }
+
+
+def groupby_sort(df: pd.DataFrame) -> dict[str, pd.DataFrame]:
+    """
+    Previous slicing of train_models: groupby, then sort and reindex every group.
+    """
+    return {
+        product: group.sort_values(by="Date").reset_index(drop=True)
+        for product, group in df.groupby("Product", sort=False, observed=True)
+    }
+
+
+def make_long_data(products: int, weeks: int, seed: int = 0) -> pd.DataFrame:
+    """
+    Long data like the one stored by the service, rows shuffled.
+    """
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range("2015-01-11", periods=weeks, freq="W")
+    df = pd.DataFrame(
+        {
+            "Product": np.repeat([f"Товар {i}, кг" for i in range(products)], weeks),
+            "Date": np.tile(dates.values, products),
+            "Price": 100 + rng.normal(0, 1, products * weeks).cumsum(),
+        }
+    )
+    return df.sample(frac=1, random_state=seed, ignore_index=True)
+
+
+def measure(run, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+    return min(times) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark per-product slicing")
+    parser.add_argument("--products", type=int, nargs="+", default=[50, 500, 2000])
+    parser.add_argument("--weeks", type=int, default=520)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'products':>8} {'rows':>9} {'implementation':<20} {'ms':>10}")
+    for products in args.products:
+        df = make_long_data(products, args.weeks)
+        dev_data, _ = split_data(df)
+        expected = groupby_sort(dev_data)
+        groups = group_by_product(dev_data)
+        assert list(groups) == list(expected)
+        for product, group in groups.items():
+            pd.testing.assert_frame_equal(
+                group.reset_index(drop=True), expected[product]
+            )
+
+        results = [
+            ("split, two masks", lambda: split_data_masks(df)),
+            ("split, one mask", lambda: split_data(df)),
+            ("filter per product", lambda: filter_per_product(dev_data)),
+            ("groupby and sort", lambda: groupby_sort(dev_data)),
+            ("group_by_product", lambda: group_by_product(dev_data)),
+        ]
+        for name, run in results:
+            # Filtering is quadratic, it takes minutes on large data
+            if name == "filter per product" and products > 50:
+                continue
+            elapsed = measure(run, args.repeat)
+            print(f"{products:>8} {len(df):>9} {name:<20} {elapsed:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
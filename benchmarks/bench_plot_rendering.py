@@ -0,0 +1,115 @@
+import argparse
+import io
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import matplotlib
+
+matplotlib.use("Agg")
+
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+from matplotlib.ticker import MaxNLocator
+
+from services.forecast import PLOT_FORMATS, PLOT_PRESETS, create_forecast_plot
+
+
+def create_forecast_plot_pyplot(
+    data, forecast_dates, forecast, product_name, train_mae, test_mae, rmse
+) -> io.BytesIO:
+    """
+    Previous pyplot based implementation, kept as a reference.
+    """
+    plt.figure(figsize=(14, 7))
+    plt.plot(data["Date"], data["Price"], label="Historical Data", marker="o")
+    plt.plot(forecast_dates, forecast, label="Forecast", linestyle="--", marker="o")
+    plt.axhline(y=100, color="g", linestyle="--", label="100%")
+    plt.legend()
+    plt.title(f"Price Forecast for {product_name}")
+    plt.xlabel("Date")
+    plt.ylabel("Price Index")
+    plt.grid(True)
+    plt.xticks(rotation=45)
+    plt.gca().xaxis.set_major_locator(MaxNLocator(integer=True))
+    plt.gca().yaxis.set_major_locator(MaxNLocator(integer=True))
+    plt.text(
+        0.02,
+        0.98,
+        f"Train MAE: {train_mae:.2f}\nTest MAE: {test_mae:.2f}\nRMSE: {rmse:.2f}",
+        transform=plt.gca().transAxes,
+        verticalalignment="top",
+        fontsize=15,
+        bbox=dict(boxstyle="round", facecolor="white", alpha=0.8),
+    )
+    plt.tight_layout()
+    buf = io.BytesIO()
+    plt.savefig(buf, format="png")
+    buf.seek(0)
+    plt.close()
+    return buf
+
+
+def make_plot_args(weeks: int, seed: int = 0) -> tuple:
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range("2015-01-11", periods=weeks, freq="W")
+    data = pd.DataFrame(
+        {"Date": dates, "Price": 100 + np.cumsum(rng.normal(0.05, 0.3, weeks))}
+    )
+    forecast_dates = pd.date_range(
+        dates[-1] + pd.Timedelta(days=7), periods=28, freq="W"
+    )
+    forecast = data["Price"].iloc[-1] + np.cumsum(rng.normal(0.05, 0.3, 28))
+    return data, forecast_dates, forecast.tolist(), "Product", 0.5, 0.7, 0.9
+
+
+def measure(render, repeat: int) -> tuple[float, int]:
+    """
+    :return: Best render time in ms and image size in bytes.
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        buf = render()
+        times.append(time.perf_counter() - start)
+    return min(times) * 1000, len(buf.getvalue())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark forecast plot rendering")
+    parser.add_argument("--weeks", type=int, default=520, help="History length")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--plots", type=int, default=32, help="Plots per thread test")
+    args = parser.parse_args()
+
+    plot_args = make_plot_args(args.weeks)
+
+    old_ms, old_size = measure(
+        lambda: create_forecast_plot_pyplot(*plot_args), args.repeat
+    )
+    print(f"{'renderer':<24} {'ms':>8} {'KB':>8}")
+    print(f"{'pyplot png':<24} {old_ms:>8.1f} {old_size / 1024:>8.1f}")
+    for preset in PLOT_PRESETS:
+        for fmt in PLOT_FORMATS:
+            ms, size = measure(
+                lambda: create_forecast_plot(*plot_args, preset=preset, fmt=fmt),
+                args.repeat,
+            )
+            print(f"{f'agg {preset} {fmt}':<24} {ms:>8.1f} {size / 1024:>8.1f}")
+
+    # Rendering does not use global state, so it can run in threads
+    for threads in sorted({1, args.threads}):
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            list(
+                executor.map(
+                    lambda _: create_forecast_plot(*plot_args), range(args.plots)
+                )
+            )
+        elapsed = time.perf_counter() - start
+        print(f"{threads} thread(s): {args.plots / elapsed:.1f} plots/s")
+
+
+if __name__ == "__main__":
+    main()
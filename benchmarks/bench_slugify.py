@@ -0,0 +1,86 @@
+import argparse
+import os
+import re
+import timeit
+
+import numpy as np
+
+import config
+from services.data_store import open_price_data
+from services.tools import TRANSLITERATION, slugify
+
+
+def slugify_replace(word: str) -> str:
+    """
+    Previous implementation with a str.replace pass per letter, kept as a reference.
+    """
+    word = word.lower()
+    for key in TRANSLITERATION:
+        word = word.replace(key, TRANSLITERATION[key])
+    word = re.sub(r"[^\w\s-]", "", word).strip()
+    word = re.sub(r"[-\s]+", "-", word)
+    return word
+
+
+def make_names(count: int, seed: int = 0) -> list[str]:
+    """
+    Names like Rosstat ones: Cyrillic words of both cases, units, punctuation,
+    digits and extra spaces.
+    """
+    rng = np.random.default_rng(seed)
+    letters = list("абвгдеёжзийклмнопрстуфхцчшщъыьэюя")
+    extras = list(" ,.-()%/«»№*") + ["  ", " - ", "10 шт."]
+    names = []
+    for _ in range(count):
+        words = []
+        for _ in range(rng.integers(1, 6)):
+            word = "".join(rng.choice(letters, rng.integers(1, 12)))
+            if rng.random() < 0.3:
+                word = word.capitalize()
+            words.append(word + (rng.choice(extras) if rng.random() < 0.4 else ""))
+        names.append(" ".join(words) + rng.choice([", кг", ", л", ", шт.", " "]))
+    return names
+
+
+def product_names(count: int) -> list[str]:
+    names = make_names(count)
+    if os.path.isfile(config.DATA_COLUMNS_PATH):
+        names = open_price_data(config.DATA_COLUMNS_PATH).products + names
+    return names
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark slugify")
+    parser.add_argument("--names", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    names = product_names(args.names)
+    expected = [slugify_replace(name) for name in names]
+    assert [slugify(name) for name in names] == expected
+    print(f"Slugs of {len(names)} names are identical to the reference implementation")
+
+    def cold():
+        slugify.cache_clear()
+        for name in names:
+            slugify(name)
+
+    def warm():
+        for name in names:
+            slugify(name)
+
+    results = [
+        ("str.replace", lambda: [slugify_replace(name) for name in names]),
+        ("translate", cold),
+        ("translate, cached", warm),
+    ]
+    baseline = None
+    print(f"{'implementation':<20} {'ms':>8} {'speedup':>8}")
+    for name, run in results:
+        elapsed = min(timeit.repeat(run, number=1, repeat=args.repeat)) * 1000
+        baseline = baseline or elapsed
+        print(f"{name:<20} {elapsed:>8.2f} {baseline / elapsed:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+import argparse
+import os
+import subprocess
+import sys
+
+import config
+
+# Libraries that must not be imported when a web worker starts
+HEAVY_MODULES = ("statsmodels", "sklearn", "scipy", "matplotlib", "openpyxl", "PIL")
+
+PROBE = """
+import resource, sys, time
+start = time.perf_counter()
+import app
+elapsed = time.perf_counter() - start
+heavy = [m for m in {heavy!r} if m in sys.modules]
+rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(elapsed, rss, ",".join(heavy))
+"""
+
+
+def run_probe() -> tuple[float, float, list[str]]:
+    """
+    Import the app in a fresh interpreter.
+
+    :return: Import time in seconds, peak RSS in MB and heavy modules imported.
+    """
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE.format(heavy=HEAVY_MODULES)],
+        cwd=config.BASE_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout.split("\n")[-2]
+    elapsed, rss, heavy = output.split(" ")
+    return float(elapsed), int(rss) / 1024, [m for m in heavy.split(",") if m]
+
+
+def import_times() -> list[tuple[int, str]]:
+    """
+    Import time of top-level packages reported by python -X importtime.
+
+    :return: Pairs of cumulative time in microseconds and package name, slowest first.
+    """
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app"],
+        cwd=config.BASE_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+        env={**os.environ, "PYTHONWARNINGS": "ignore"},
+    ).stderr
+
+    packages: dict[str, int] = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        # First import of a package includes imports of its submodules
+        package = name.strip().split(".")[0]
+        packages[package] = max(packages.get(package, 0), int(cumulative))
+    packages.pop("app", None)
+    return sorted(((time, name) for name, time in packages.items()), reverse=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark web worker startup")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="Slowest imports to show")
+    args = parser.parse_args()
+
+    results = [run_probe() for _ in range(args.repeat)]
+    elapsed = min(result[0] for result in results)
+    rss = min(result[1] for result in results)
+    heavy = results[0][2]
+    print(f"import app: {elapsed * 1000:.0f} ms, peak RSS {rss:.0f} MB")
+    print(f"heavy modules imported: {', '.join(heavy) or 'none'}")
+
+    print(f"{'package':<32} {'ms':>8}")
+    for cumulative, name in import_times()[: args.top]:
+        print(f"{name:<32} {cumulative / 1000:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
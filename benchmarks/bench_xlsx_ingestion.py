@@ -0,0 +1,123 @@
+import argparse
+import os
+import tempfile
+import time
+from datetime import date, timedelta
+
+import numpy as np
+import openpyxl
+import pandas as pd
+
+from services.process_data.download_data import xlsx_to_dataframe
+from services.tools import MONTH_MAPPING, parse_dates
+
+MONTH_NAMES = list(MONTH_MAPPING)
+
+
+def xlsx_to_dataframe_pandas(xlsx_file_path: str) -> pd.DataFrame:
+    """
+    Previous pd.read_excel based implementation, kept as a reference.
+    """
+    xls = pd.ExcelFile(xlsx_file_path)
+    sheet_names = xls.sheet_names
+
+    years = []
+    for sheet_name in sheet_names[1:]:
+        df_current = pd.read_excel(xlsx_file_path, sheet_name=sheet_name, skiprows=3)
+        df_current = df_current[~df_current.iloc[:, 1:].isna().all(axis=1)]
+        new_headers = [df_current.columns[0]] + [
+            parse_dates.__wrapped__(str(header), int(sheet_name))
+            for header in df_current.columns[1:]
+        ]
+        df_current.columns = new_headers
+        years.append(df_current)
+
+    combined_df = pd.concat([df.set_index("Наименование") for df in years], axis=1)
+    combined_df.sort_index(inplace=True)
+    return combined_df.reset_index()
+
+
+def make_workbook(path: str, years: int, products: int, seed: int = 0) -> None:
+    """
+    Workbook laid out like the Rosstat one: table of contents, then a sheet per year
+    with title rows, header of weekly dates, section rows and product rows.
+    """
+    rng = np.random.default_rng(seed)
+    names = [f"Товар {i}, кг" for i in range(products)]
+    workbook = openpyxl.Workbook(write_only=True)
+    workbook.create_sheet("Содержание").append(["Содержание"])
+
+    for year in range(2024 - years + 1, 2025):
+        sheet = workbook.create_sheet(str(year))
+        for title in ("Средние потребительские цены", "", "рублей"):
+            sheet.append([title])
+
+        day = date(year, 1, 1)
+        day += timedelta(days=(6 - day.weekday()) % 7)
+        header = ["Наименование"]
+        while day.year == year:
+            header.append(f"на {day.day} {MONTH_NAMES[day.month - 1]}")
+            day += timedelta(days=7)
+        header[1] += "*"
+        sheet.append(header)
+
+        prices = 100 + np.cumsum(rng.normal(0.1, 0.3, (products, len(header) - 1)), 1)
+        for i, name in enumerate(names):
+            if i % 100 == 0:
+                sheet.append(["Продовольственные товары"])
+            row = [name] + np.round(prices[i], 2).tolist()
+            if i % 50 == 7:
+                row[3] = "..."
+            sheet.append(row)
+    workbook.save(path)
+
+
+def measure(read, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        read()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Rosstat xlsx ingestion")
+    parser.add_argument("--years", type=int, default=8)
+    parser.add_argument("--products", type=int, default=500)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "data.xlsx")
+        make_workbook(path, args.years, args.products)
+        print(
+            f"{args.years} sheets, {args.products} products, "
+            f"{os.path.getsize(path) / 1024:.0f} KB"
+        )
+
+        expected = xlsx_to_dataframe_pandas(path)
+        pd.testing.assert_frame_equal(
+            xlsx_to_dataframe(path), expected, check_dtype=False
+        )
+        print("Results are identical to the pd.read_excel implementation")
+
+        results = [
+            ("pd.read_excel", lambda: xlsx_to_dataframe_pandas(path)),
+            ("openpyxl", lambda: xlsx_to_dataframe(path)),
+            (
+                f"openpyxl, {args.workers} workers",
+                lambda: xlsx_to_dataframe(path, max_workers=args.workers),
+            ),
+        ]
+        baseline = None
+        print(f"{'reader':<24} {'s':>8} {'speedup':>8}")
+        for name, read in results:
+            elapsed = measure(read, args.repeat)
+            baseline = baseline or elapsed
+            print(f"{name:<24} {elapsed:>8.2f} {baseline / elapsed:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,340 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import tempfile
+import time
+import timeit
+from datetime import datetime
+from typing import Any, Callable, Optional
+
+import numpy as np
+import pandas as pd
+
+import config
+from benchmarks.bench_xlsx_ingestion import make_workbook
+from services.cache_generation import bump_generation
+from services.data_store import get_product_data, open_price_data, save_price_data
+from services.forecast import (
+    constrain_forecast,
+    constrain_forecasts,
+    create_forecast_plot,
+    get_model_dict,
+    load_data,
+)
+from services.forecast_table import build_forecast_table, get_forecast_row
+from services.forecaster import (
+    HoltWintersForecaster,
+    load_model_artifact,
+    model_file_path,
+    save_model_artifact,
+)
+from services.plot_cache import get_plot_file
+from services.process_data.auto_process_data import auto_process_data
+from services.process_data.clean_data import clean_data, wide_to_long
+from services.process_data.download_data import xlsx_to_dataframe
+
+# Number of products and years of weekly data
+SCALES = {"small": (50, 5), "medium": (500, 10), "large": (5000, 20)}
+RESULTS_DIR = os.path.join(config.BASE_DIR, "benchmarks", "results")
+
+# Directories of the service are moved to a temporary one for the benchmark
+_SERVICE_PATHS = [
+    name
+    for name in dir(config)
+    if name.endswith(("_DIR", "_PATH"))
+    and name not in ("BASE_DIR", "TEMPLATES_DIR", "STATIC_DIR")
+]
+
+
+def use_root(root: str) -> None:
+    """
+    Point data, models, jobs and cache directories of the service to root.
+    Must be called before the app is imported, the response cache reads its
+    directory on import.
+    """
+    for name in _SERVICE_PATHS:
+        path = getattr(config, name)
+        setattr(
+            config, name, os.path.join(root, os.path.relpath(path, config.BASE_DIR))
+        )
+    for name in ("DATA_DIR", "MODELS_DIR", "JOBS_DIR", "CACHE_DIR"):
+        os.makedirs(getattr(config, name), exist_ok=True)
+
+
+def reset_root() -> None:
+    """
+    Remove data and models of the previous scale.
+    """
+    for name in ("DATA_DIR", "MODELS_DIR"):
+        shutil.rmtree(getattr(config, name))
+        os.makedirs(getattr(config, name))
+    bump_generation()
+
+
+def measure(run: Callable, repeat: int, number: Optional[int] = None) -> dict:
+    """
+    Time of one call in ms. Fast functions are called in loops of number calls,
+    chosen automatically to take at least 0.2 s.
+    """
+    timer = timeit.Timer(run)
+    if number is None:
+        number, _ = timer.autorange()
+    times = [t / number * 1000 for t in timer.repeat(repeat=repeat, number=number)]
+    return {"ms": min(times), "median_ms": float(np.median(times)), "calls": number}
+
+
+def measure_requests(client, urls: list[str], requests: int) -> dict:
+    """
+    Sequential throughput of Flask test client requests cycling through urls.
+    """
+    latencies = []
+    start = time.perf_counter()
+    for i in range(requests):
+        request_start = time.perf_counter()
+        response = client.get(urls[i % len(urls)])
+        latencies.append((time.perf_counter() - request_start) * 1000)
+        assert response.status_code == 200, (urls[i % len(urls)], response.status)
+    elapsed = time.perf_counter() - start
+    return {
+        "ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+        "requests_per_second": requests / elapsed,
+    }
+
+
+def save_synthetic_models(seed: int = 0) -> None:
+    """
+    Save models of all products without training: additive Holt-Winters states
+    close to the last prices, so serving code gets realistic inputs.
+    """
+    rng = np.random.default_rng(seed)
+    data = get_product_data()
+    for i, (product, slug) in enumerate(data.product_pairs):
+        prices = np.asarray(data.prices[data.offsets[i] : data.offsets[i + 1]])
+        model = HoltWintersForecaster(
+            level=prices[-1],
+            trend_state=rng.normal(0.05, 0.05),
+            seasonal_states=rng.normal(0, 0.5, 12),
+            fittedvalues=prices + rng.normal(0, 0.3, len(prices)),
+            trend="add",
+            seasonal="add",
+        )
+        save_model_artifact(
+            model_file_path(config.MODELS_DIR, slug),
+            {
+                "model": model,
+                "url": f"/forecast/{slug}",
+                "product_name": product,
+                "model_spec": "add-add12",
+                "train_mae": 0.3,
+                "test_mae": 0.6,
+                "date_created": datetime.now(),
+                "residual_mse": 0.09,
+            },
+        )
+
+
+def run_scale(
+    products: int, years: int, args: argparse.Namespace, root: str
+) -> dict[str, Any]:
+    results: dict[str, dict] = {}
+
+    def record(name, result):
+        results[name] = result
+        print(f"  {name:<36} {result['ms']:>12.3f} ms")
+
+    reset_root()
+    xlsx_path = os.path.join(root, "data.xlsx")
+    make_workbook(xlsx_path, years, products)
+
+    # Ingestion, slow enough to be timed once
+    record("xlsx_to_dataframe", measure(lambda: xlsx_to_dataframe(xlsx_path), 1, 1))
+    df = xlsx_to_dataframe(xlsx_path)
+    record("clean_data", measure(lambda: clean_data(df), args.repeat))
+    df = clean_data(df)
+    record("wide_to_long", measure(lambda: wide_to_long(df), args.repeat))
+    df_long = wide_to_long(df)
+    rows = len(df_long)
+
+    columns_path = config.DATA_COLUMNS_PATH
+    record(
+        "save_price_data",
+        measure(lambda: save_price_data(df_long, columns_path), args.repeat, 1),
+    )
+    record(
+        "open_price_data", measure(lambda: open_price_data(columns_path), args.repeat)
+    )
+    data = get_product_data()
+    slugs = [slug for _, slug in data.product_pairs]
+    sample = slugs[:: max(1, len(slugs) // 50)]
+    record("load_data", measure(lambda: load_data(sample[0]), args.repeat))
+
+    save_synthetic_models()
+    model_path = model_file_path(config.MODELS_DIR, sample[0])
+    record(
+        "load_model_artifact",
+        measure(lambda: load_model_artifact(model_path), args.repeat),
+    )
+    get_model_dict(sample[0])
+    record(
+        "get_model_dict, cached",
+        measure(lambda: get_model_dict(sample[0]), args.repeat),
+    )
+    model = get_model_dict(sample[0])["model"]
+    record("model.forecast", measure(lambda: model.forecast(28), args.repeat))
+
+    _, _, prices = data.get_product(sample[0])
+    forecast = model.forecast(28)
+    record(
+        "constrain_forecast",
+        measure(lambda: constrain_forecast(prices, forecast), args.repeat),
+    )
+    last_values = np.asarray(data.prices[data.offsets[1:] - 1])
+    forecasts = last_values[:, None] * np.linspace(0.9, 1.1, 28)[None, :]
+    record(
+        "constrain_forecasts, all products",
+        measure(lambda: constrain_forecasts(last_values, forecasts), args.repeat),
+    )
+
+    record("build_forecast_table", measure(build_forecast_table, args.repeat, 1))
+    row = get_forecast_row(sample[0])
+    plot_data = load_data(sample[0])
+    plot_dates = pd.to_datetime(row["dates"])
+    record(
+        "create_forecast_plot",
+        measure(
+            lambda: create_forecast_plot(
+                plot_data,
+                plot_dates,
+                row["constrained_forecast"],
+                row["product_name"],
+                row["train_mae"],
+                row["test_mae"],
+                row["rmse"],
+            ),
+            args.repeat,
+            1,
+        ),
+    )
+
+    # Imported here, the response cache must use the benchmark directory
+    from app import app
+
+    client = app.test_client()
+    for slug in sample:
+        get_plot_file(slug)
+    endpoints = {
+        "GET /get_products": ["/get_products"],
+        "GET /forecast/<product>": [f"/forecast/{slug}" for slug in sample],
+        "GET /forecast/<product>.json": [f"/forecast/{slug}.json" for slug in sample],
+    }
+    for name, urls in endpoints.items():
+        record(name, measure_requests(client, urls, args.requests))
+
+    if products <= args.pipeline_products:
+        wide_path = config.DATA_FILE_PATH
+        xlsx_to_dataframe(xlsx_path).to_csv(wide_path, index=False)
+        start = time.perf_counter()
+        summary = auto_process_data()
+        record(
+            "auto_process_data",
+            {
+                "ms": (time.perf_counter() - start) * 1000,
+                "stages_ms": {k: v * 1000 for k, v in summary["stages"].items()},
+            },
+        )
+
+    return {"products": products, "years": years, "rows": rows, "results": results}
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=config.BASE_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(report: dict[str, Any], baseline: dict[str, Any]) -> None:
+    """
+    Print times of the report relative to the baseline, above 1 is slower.
+    """
+    print(f"\nCompared to {baseline.get('commit')} from {baseline['date_created']}")
+    print(f"{'scale':<8} {'benchmark':<36} {'ms':>12} {'baseline':>12} {'ratio':>8}")
+    for scale, scale_report in report["scales"].items():
+        baseline_results = baseline["scales"].get(scale, {}).get("results", {})
+        for name, result in scale_report["results"].items():
+            if name not in baseline_results:
+                continue
+            before = baseline_results[name]["ms"]
+            print(
+                f"{scale:<8} {name:<36} {result['ms']:>12.3f} {before:>12.3f} "
+                f"{result['ms'] / before:>8.2f}"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark serving and training hot paths on synthetic data"
+    )
+    parser.add_argument(
+        "--scales", nargs="+", choices=SCALES, default=["small", "medium"]
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--requests", type=int, default=200, help="Per endpoint")
+    parser.add_argument(
+        "--pipeline-products",
+        type=int,
+        default=50,
+        help="Run full auto_process_data only on scales with up to this many products",
+    )
+    parser.add_argument(
+        "--output", help="Results file, by default in benchmarks/results"
+    )
+    parser.add_argument("--compare", help="Results file of a previous run")
+    args = parser.parse_args()
+
+    commit = git_commit()
+    report = {
+        "date_created": datetime.now().isoformat(timespec="seconds"),
+        "commit": commit,
+        "environment": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "cpus": os.cpu_count(),
+            "training_workers": config.TRAINING_WORKERS,
+            "model_selection": config.MODEL_SELECTION,
+        },
+        "scales": {},
+    }
+    with tempfile.TemporaryDirectory() as root:
+        use_root(root)
+        for scale in args.scales:
+            products, years = SCALES[scale]
+            print(f"{scale}: {products} products, {years} years")
+            report["scales"][scale] = run_scale(products, years, args, root)
+
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"{datetime.now():%Y%m%d-%H%M%S}-{commit or 'unknown'}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"Results saved to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,44 @@
+import hashlib
+import os
+
+from flask import g, request
 from flask_caching import Cache
 
-cache = Cache(config={"CACHE_TYPE": "simple"})
+import config
+from services.cache_generation import get_generation
+
+# Responses are stored on disk and shared by all gunicorn workers on the host.
+# CACHE_TYPE=SimpleCache keeps them in the memory of every worker instead.
+cache = Cache(
+    config={
+        "CACHE_TYPE": os.getenv("CACHE_TYPE", "FileSystemCache"),
+        "CACHE_DIR": config.CACHE_RESPONSES_DIR,
+        "CACHE_THRESHOLD": int(os.getenv("CACHE_THRESHOLD", 10000)),
+        "CACHE_DEFAULT_TIMEOUT": 60 * 60,
+    }
+)
+
+
+def make_cache_key(*args, **kwargs) -> str:
+    """
+    Cache key of the current request: path and query string prefixed with the
+    generation of models and data, so retraining or erasing invalidates responses
+    cached by all workers at once. The lookup is counted as a hit, see count_miss.
+    """
+    g.response_cache = "hit"
+    query = sorted(request.args.items(multi=True))
+    digest = hashlib.md5(f"{request.path}?{query}".encode()).hexdigest()
+    return f"{get_generation()}:{digest}"
+
+
+def count_miss(response) -> bool:
+    """
+    Response filter of cached endpoints, called only when the response is not
+    found in the cache. Marks the lookup as a miss for response cache metrics
+    and lets every response be cached.
+    """
+    g.response_cache = "miss"
+    return True
 
 
 def init_cache(app):
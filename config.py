@@ -5,7 +5,58 @@ ROSSTAT_CPI_DATA_URL = "https://rosstat.gov.ru/storage/mediabank/Nedel_ipc.xlsx"
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DATA_DIR = os.path.join(BASE_DIR, "data")  # Directory with temporary data
-DATA_FILE_PATH = os.path.join(DATA_DIR, "price_data_long.csv")
+DATA_FILE_PATH = os.path.join(DATA_DIR, "price_data_long.csv")  # CSV export
+UPLOADS_DIR = os.path.join(DATA_DIR, "uploads")  # Uploaded sheets, one per job
+# Cleaned data in columnar format used by the service, see services.data_store
+DATA_COLUMNS_PATH = os.path.join(DATA_DIR, "price_data_long.cols")
+FORECASTS_FILE_PATH = os.path.join(DATA_DIR, "forecasts.json")  # Serving table
+PLOTS_DIR = os.path.join(DATA_DIR, "plots")  # Rendered plots shared by workers
+BACKTEST_REPORT_PATH = os.path.join(DATA_DIR, "backtest.json")  # Last backtest
 MODELS_DIR = os.path.join(BASE_DIR, "models/trained_models")
+JOBS_DIR = os.path.join(BASE_DIR, "jobs")  # State of background jobs
+# Response cache shared by workers and generation of models and data its keys
+# include. Kept apart from data and models, so erasing them does not reset it
+CACHE_DIR = os.path.join(BASE_DIR, "cache")
+CACHE_RESPONSES_DIR = os.path.join(CACHE_DIR, "responses")
+CACHE_GENERATION_PATH = os.path.join(CACHE_DIR, "generation")
+# Request metrics of every worker process, merged by /metrics, and request
+# profiles. Profiling of requests with ?profile=1 is enabled with PROFILING=1
+METRICS_DIR = os.path.join(BASE_DIR, "metrics")
+PROFILES_DIR = os.path.join(METRICS_DIR, "profiles")
+PROFILING = os.getenv("PROFILING", "0") == "1"
+# Number of the latest profiles kept in PROFILES_DIR, older ones are removed
+PROFILES_KEEP = int(os.getenv("PROFILES_KEEP", 100))
+MODEL_FILE_EXTENSION = ".npz"
 TEMPLATES_DIR = os.path.join(BASE_DIR, "templates")
 STATIC_DIR = os.path.join(BASE_DIR, "static")
+
+FORECAST_HORIZON = 28  # Weeks
+
+# Download of the Rosstat data sheet: timeout of connecting and of every read in
+# seconds, and number of attempts, interrupted downloads are resumed
+DOWNLOAD_TIMEOUT = float(os.getenv("DOWNLOAD_TIMEOUT", 30))
+DOWNLOAD_RETRIES = int(os.getenv("DOWNLOAD_RETRIES", 3))
+
+# Number of processes used to train models, one model per product
+TRAINING_WORKERS = int(os.getenv("TRAINING_WORKERS", os.cpu_count() or 1))
+
+# Model selection, see services.process_data.model_selection: whether to search
+# model candidates per product, time of candidate fits per product as a multiple
+# of the fit of the default model and ratio to the best test MAE above which
+# a seasonality is pruned. With budget 4, retraining 49 products with 5 years of
+# data on one CPU took about 3.2 times as long as with the default model only
+# (28-30 s instead of 9 s) and mean test MAE went from 2.00 to 1.04. Unlimited
+# search took 9 times as long for MAE 0.99
+MODEL_SELECTION = os.getenv("MODEL_SELECTION", "1") != "0"
+MODEL_SELECTION_BUDGET = float(os.getenv("MODEL_SELECTION_BUDGET", 4))
+MODEL_SELECTION_PRUNE_RATIO = float(os.getenv("MODEL_SELECTION_PRUNE_RATIO", 1.25))
+
+# Rolling-origin backtesting, see services.process_data.backtest: number of
+# forecast origins per product, weeks between them and weeks forecast from each
+BACKTEST_ORIGINS = int(os.getenv("BACKTEST_ORIGINS", 8))
+BACKTEST_STEP = int(os.getenv("BACKTEST_STEP", 4))
+BACKTEST_HORIZON = int(os.getenv("BACKTEST_HORIZON", 12))
+
+# Limits of in-memory cache of loaded models, size is estimated by model file size
+MODEL_CACHE_SIZE = int(os.getenv("MODEL_CACHE_SIZE", 512))
+MODEL_CACHE_MAX_BYTES = int(os.getenv("MODEL_CACHE_MAX_BYTES", 512 * 1024 * 1024))
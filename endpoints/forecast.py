@@ -1,55 +1,65 @@
-from datetime import datetime
+import numpy as np
+from flask import Blueprint, jsonify, request, send_file
 
-import pandas as pd
-from flask import Blueprint, jsonify, send_file
-
-from cache import cache
+import config
+from cache import cache, count_miss, make_cache_key
+from services.batch_forecast import forecast_dates, get_forecast_engine
+from services.data_store import get_product_data
 from services.forecast import (
-    calculate_rmse,
-    constrain_forecast,
-    create_forecast_plot,
+    PLOT_FORMATS,
+    PLOT_PRESETS,
+    constrain_forecasts,
     get_model_dict,
-    load_data,
 )
+from services.forecast_table import get_forecast_row
+from services.plot_cache import get_plot_file
 
 forecast_bp = Blueprint("forecast", __name__)
 
 
 @forecast_bp.route("/forecast/<product_name>")
-@cache.cached(timeout=60 * 60, query_string=True)
 def get_forecast_plot(product_name):
     """
     Return plot as an image for the given product name.
-    """
-    data = load_data(product_name)
-    model_dict = get_model_dict(product_name)
+    Plots are pre-rendered after training and stored on disk, the response
+    supports conditional requests with ETag and Last-Modified.
 
-    model = model_dict["model"]
+    Query parameters:
+        preset: Image size, one of PLOT_PRESETS, "default" by default.
+        format: Image format, one of PLOT_FORMATS, "png" by default.
+    """
+    preset = request.args.get("preset", "default")
+    fmt = request.args.get("format", "png")
+    if preset not in PLOT_PRESETS or fmt not in PLOT_FORMATS:
+        return jsonify({"success": False, "error": "Unsupported preset or format"}), 400
 
-    forecast_horizon = 28
-    last_date = datetime.strptime(data["Date"].max(), "%Y-%m-%d")
-    forecast_dates = pd.date_range(
-        start=last_date + pd.Timedelta(days=7), periods=forecast_horizon, freq="W"
+    try:
+        path, key = get_plot_file(product_name, preset, fmt)
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 404
+    return send_file(
+        path, mimetype=PLOT_FORMATS[fmt], etag=key, conditional=True, max_age=0
     )
-    forecast = model.forecast(steps=forecast_horizon)
-    forecast = constrain_forecast(data["Price"], forecast)
-
-    data["Date"] = pd.to_datetime(data["Date"])
-
-    train_mae = model_dict["train_mae"]
-    test_mae = model_dict["test_mae"]
-    rmse = calculate_rmse(model, data)
-    plot_title = model_dict["product_name"]
 
-    buf = create_forecast_plot(
-        data, forecast_dates, forecast, plot_title, train_mae, test_mae, rmse
-    )
 
-    return send_file(buf, mimetype="image/png")
+@forecast_bp.route("/forecast/<product_name>.json")
+@cache.cached(
+    timeout=60 * 60, make_cache_key=make_cache_key, response_filter=count_miss
+)
+def get_forecast_json(product_name):
+    """
+    Return precomputed forecast for the given product name as JSON.
+    """
+    try:
+        return jsonify(get_forecast_row(product_name))
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 404
 
 
 @forecast_bp.route("/get_metadata/<product_name>")
-@cache.cached(timeout=60 * 60, query_string=True)
+@cache.cached(
+    timeout=60 * 60, make_cache_key=make_cache_key, response_filter=count_miss
+)
 def get_metadata(product_name):
     """
     Return metadata for a given product.
@@ -66,3 +76,49 @@ def get_metadata(product_name):
         return jsonify(model_dict)
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
+
+
+@forecast_bp.route("/forecasts")
+@cache.cached(
+    timeout=60 * 60, make_cache_key=make_cache_key, response_filter=count_miss
+)
+def get_forecasts():
+    """
+    Return forecasts for many products as JSON, computed in one vectorized call.
+
+    Query parameters:
+        products: Comma separated product slugs, all products by default.
+        steps: Forecast horizon in weeks, FORECAST_HORIZON from config.py by default.
+    """
+    # type=int of request.args.get falls back to the default on malformed values
+    try:
+        steps = int(request.args.get("steps", config.FORECAST_HORIZON))
+    except ValueError:
+        steps = None
+    if steps is None or not 1 <= steps <= 520:
+        return jsonify({"success": False, "error": "steps must be 1..520"}), 400
+    products = request.args.get("products")
+    product_slugs = products.split(",") if products else None
+
+    engine = get_forecast_engine()
+    try:
+        slugs, forecasts = engine.forecast(steps, product_slugs)
+        last_dates, last_prices = get_product_data().last_points(slugs)
+    except (KeyError, ValueError) as e:
+        return jsonify({"success": False, "error": e.args[0]}), 404
+
+    dates = forecast_dates(last_dates, steps)
+    dates = np.datetime_as_string(dates, unit="D").tolist()
+    constrained = constrain_forecasts(last_prices, forecasts).tolist()
+    forecasts = forecasts.tolist()
+    return jsonify(
+        {
+            slug: {
+                "product_name": engine.product_names[slug],
+                "dates": dates[i],
+                "forecast": forecasts[i],
+                "constrained_forecast": constrained[i],
+            }
+            for i, slug in enumerate(slugs)
+        }
+    )
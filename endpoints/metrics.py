@@ -0,0 +1,13 @@
+from flask import Blueprint, Response
+
+from services.metrics import render_metrics
+
+metrics_bp = Blueprint("metrics", __name__)
+
+
+@metrics_bp.route("/metrics")
+def get_metrics():
+    """
+    Return metrics of all workers in Prometheus text format.
+    """
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
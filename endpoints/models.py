@@ -3,10 +3,14 @@ from werkzeug.exceptions import HTTPException
 
 import config
 from cache import cache
+from services.cache_generation import bump_generation
+from services.jobs import get_job, list_jobs, submit_job
 from services.process_data.auto_process_data import (
     handle_model_creation_with_url,
     handle_model_upload,
+    job_response,
 )
+from services.process_data.backtest import BACKTEST_SPECS, read_report, run_backtest
 from services.tools import check_models_availability, delete_files_in_directory
 
 models_bp = Blueprint("models", __name__)
@@ -20,23 +24,86 @@ def check_models_availability_endpoint():
 
 @models_bp.route("/models", methods=["GET", "POST"])
 def create_models():
-    """Endpoint to create models either by uploading a CSV file or using a custom URL."""
+    """
+    Endpoint to create models either by uploading a CSV file or using a custom URL.
+    Starts a background job and returns its id, see /models/jobs/<job_id>.
+
+    Downloaded data is merged into the stored dataset and models are retrained
+    only if it changed. Pass full=1 to rebuild everything from the downloaded data.
+    """
     if request.method == "POST":
         return handle_model_upload(request.files)
     elif request.method == "GET":
         return handle_model_creation_with_url(
-            request.args.get("url", config.ROSSTAT_CPI_DATA_URL)
+            request.args.get("url", config.ROSSTAT_CPI_DATA_URL),
+            incremental=request.args.get("full") != "1",
         )
     else:
         raise HTTPException("Unsupported request method")
 
 
+@models_bp.route("/models/jobs")
+def get_jobs():
+    """Endpoint to list recent background jobs."""
+    return jsonify(list_jobs()), 200
+
+
+@models_bp.route("/models/jobs/<job_id>")
+def get_job_status(job_id):
+    """Endpoint to get stage, progress, ETA and final status of a background job."""
+    job = get_job(job_id)
+    if job is None:
+        return jsonify({"success": False, "error": "Job not found"}), 404
+    return jsonify(job), 200
+
+
+@models_bp.route("/backtest", methods=["GET", "POST"])
+def backtest():
+    """
+    Endpoint of rolling-origin backtesting of forecasts.
+    GET returns the report of the last backtest, POST starts a new one in
+    a background job and returns its id, see /models/jobs/<job_id>.
+
+    Query parameters of POST:
+        spec: Kind of models, one of BACKTEST_SPECS, "saved" by default.
+        horizon, origins, step: Weeks forecast from every origin, number of
+            origins and weeks between them, defaults are at config.py.
+    """
+    if request.method == "GET":
+        report = read_report()
+        if report is None:
+            return jsonify({"success": False, "error": "No backtest report"}), 404
+        return jsonify(report), 200
+
+    spec = request.args.get("spec", "saved")
+    if spec not in BACKTEST_SPECS:
+        return jsonify({"success": False, "error": f"Unknown spec '{spec}'"}), 400
+    # type=int of request.args.get falls back to the default on malformed values
+    params = {}
+    for name in ("horizon", "origins", "step"):
+        if name not in request.args:
+            continue
+        try:
+            params[name] = int(request.args[name])
+        except ValueError:
+            params[name] = 0
+        if params[name] < 1:
+            error = f"{name} must be a positive integer"
+            return jsonify({"success": False, "error": error}), 400
+    try:
+        job_id = submit_job("backtest", run_backtest, spec=spec, **params)
+        return job_response(job_id)
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+
+
 @models_bp.route("/erase")
 def erase_models():
     """Endpoint to erase all models and clear the cache."""
     try:
         delete_files_in_directory(config.DATA_DIR)
         delete_files_in_directory(config.MODELS_DIR)
+        bump_generation()
         cache.clear()
         flash("Models successfully deleted.", "info")
         return jsonify({"success": True}), 200
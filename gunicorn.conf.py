@@ -0,0 +1,16 @@
+import os
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:8000")
+workers = int(os.getenv("GUNICORN_WORKERS", 4))
+
+# Import the app in the master process, so workers are forked with it loaded
+preload_app = True
+
+
+def when_ready(server):
+    """
+    Runs in the master process after the app is loaded and before workers are forked.
+    """
+    from services.preload import preload_serving_state
+
+    preload_serving_state()
@@ -0,0 +1,198 @@
+import glob
+import os
+import threading
+from typing import Any, Iterable, Optional
+
+import numpy as np
+
+import config
+from services.forecaster import load_model_artifact
+from services.metrics import metrics, span, timed
+
+
+class ForecastEngine:
+    """
+    States of all trained models stacked into arrays, so forecasts for any set
+    of products are computed with a few vectorized operations.
+
+    Models are grouped by their kind (trend, seasonality, damping, seasonal periods)
+    and every group is forecasted at once.
+    """
+
+    def __init__(
+        self,
+        models: dict[str, dict[str, Any]],
+        version: Any = None,
+        file_versions: Optional[dict[str, tuple]] = None,
+    ):
+        """
+        :param models: Model metadata dictionaries by product slug.
+        :param version: Version of the models directory the models were loaded from.
+        :param file_versions: Versions of model files by product slug, models whose
+            files did not change are reused by the next engine.
+        """
+        self.version = version
+        self.file_versions = file_versions or {}
+        self.models = models
+        self.product_names = {slug: m["product_name"] for slug, m in models.items()}
+
+        kinds: dict[tuple, list[str]] = {}
+        for slug, model_dict in models.items():
+            model = model_dict["model"]
+            kind = (model.trend, model.seasonal, model.damped, model.seasonal_periods)
+            kinds.setdefault(kind, []).append(slug)
+
+        # slug -> (group index, row in the group)
+        self.index: dict[str, tuple[int, int]] = {}
+        self.groups = []
+        for (trend, seasonal, damped, m), slugs in kinds.items():
+            group_models = [models[slug]["model"] for slug in slugs]
+            for row, slug in enumerate(slugs):
+                self.index[slug] = (len(self.groups), row)
+            self.groups.append(
+                {
+                    "trend": trend,
+                    "seasonal": seasonal,
+                    "damped": damped,
+                    "slugs": slugs,
+                    "level": np.array([model.level for model in group_models]),
+                    "trend_state": np.array(
+                        [model.trend_state for model in group_models]
+                    ),
+                    "damping_trend": np.array(
+                        [model.damping_trend for model in group_models]
+                    ),
+                    "seasonal_states": np.array(
+                        [model.seasonal_states for model in group_models]
+                    ).reshape(len(slugs), m),
+                }
+            )
+
+        # Engine is shared by threads and, when preloaded, by forked workers
+        for group in self.groups:
+            for value in group.values():
+                if isinstance(value, np.ndarray):
+                    value.flags.writeable = False
+
+    @staticmethod
+    def _forecast_group(group: dict[str, Any], rows: np.ndarray, steps: int):
+        h = np.arange(1, steps + 1)
+        level = group["level"][rows, None]
+        trend_state = group["trend_state"][rows, None]
+
+        if group["damped"]:
+            phi_h = np.cumsum(group["damping_trend"][rows, None] ** h, axis=1)
+        else:
+            phi_h = np.broadcast_to(h.astype(np.float64), (len(rows), steps))
+
+        if group["trend"] == "add":
+            forecast = level + trend_state * phi_h
+        elif group["trend"] == "mul":
+            forecast = level * trend_state**phi_h
+        else:
+            forecast = np.repeat(level, steps, axis=1)
+
+        if group["seasonal"]:
+            seasonal_states = group["seasonal_states"][rows]
+            season = seasonal_states[:, h % seasonal_states.shape[1]]
+            if group["seasonal"] == "add":
+                forecast = forecast + season
+            else:
+                forecast = forecast * season
+        return forecast
+
+    @timed("forecast")
+    def forecast(
+        self, steps: int, product_slugs: Optional[Iterable[str]] = None
+    ) -> tuple[list[str], np.ndarray]:
+        """
+        Forecast given number of steps for selected products.
+
+        :param steps: Forecast horizon.
+        :param product_slugs: Slugs of products to forecast, all products by default.
+        :return: Product slugs and forecasts as array of shape (products, steps),
+            rows are in the same order as slugs.
+        """
+        if product_slugs is None:
+            product_slugs = list(self.index)
+        else:
+            product_slugs = list(product_slugs)
+            unknown = [slug for slug in product_slugs if slug not in self.index]
+            if unknown:
+                raise KeyError(f"No models found for {', '.join(unknown)}")
+
+        # Select rows of every group, forecast the group at once and put results back
+        result = np.empty((len(product_slugs), steps))
+        positions: dict[int, tuple[list[int], list[int]]] = {}
+        for position, slug in enumerate(product_slugs):
+            group_index, row = self.index[slug]
+            group_positions, group_rows = positions.setdefault(group_index, ([], []))
+            group_positions.append(position)
+            group_rows.append(row)
+
+        for group_index, (group_positions, group_rows) in positions.items():
+            result[group_positions] = self._forecast_group(
+                self.groups[group_index], np.array(group_rows), steps
+            )
+        return product_slugs, result
+
+
+def forecast_dates(last_dates: np.ndarray, steps: int) -> np.ndarray:
+    """
+    Vectorized equivalent of pd.date_range(last_date + 7 days, periods=steps, freq="W")
+    for many last dates: weekly dates starting from the first Sunday a week after.
+
+    :param last_dates: Array of last known dates.
+    :param steps: Forecast horizon.
+    :return: Array of dates of shape (len(last_dates), steps).
+    """
+    start = last_dates.astype("datetime64[D]") + np.timedelta64(7, "D")
+    # 1970-01-01 was Thursday, so Monday is 0 and Sunday is 6
+    weekday = (start.astype(np.int64) + 3) % 7
+    first_sunday = start + ((6 - weekday) % 7).astype("timedelta64[D]")
+    return first_sunday[:, None] + (7 * np.arange(steps)).astype("timedelta64[D]")
+
+
+_engine: Optional[ForecastEngine] = None
+_engine_lock = threading.Lock()
+
+
+def _file_version(path: str) -> tuple:
+    stat = os.stat(path)
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+def get_forecast_engine() -> ForecastEngine:
+    """
+    Return process-wide forecast engine. The engine is rebuilt when the models
+    directory changes: models are saved with rename, which updates its mtime.
+    Only models whose files changed are loaded again, so rebuilds during
+    retraining, after every saved model, are cheap.
+    """
+    global _engine
+
+    version = os.stat(config.MODELS_DIR).st_mtime_ns
+    engine = _engine
+    if engine is not None and engine.version == version:
+        return engine
+
+    with _engine_lock, span("model"):
+        if _engine is None or _engine.version != version:
+            previous = _engine
+            models, file_versions = {}, {}
+            loaded = 0
+            pattern = os.path.join(config.MODELS_DIR, f"*{config.MODEL_FILE_EXTENSION}")
+            for path in glob.glob(pattern):
+                slug = os.path.basename(path)[: -len(config.MODEL_FILE_EXTENSION)]
+                file_versions[slug] = _file_version(path)
+                if previous and previous.file_versions.get(slug) == file_versions[slug]:
+                    models[slug] = previous.models[slug]
+                else:
+                    models[slug] = load_model_artifact(path)
+                    loaded += 1
+            _engine = ForecastEngine(models, version, file_versions)
+            metrics.inc("model_loads_total", loaded, source="engine")
+            print(
+                f"Forecast engine loaded {loaded} of {len(models)} models"
+            )  # logger.info
+        return _engine
@@ -0,0 +1,31 @@
+import fcntl
+
+import config
+from services.tools import atomic_write, ensure_directory_exists_and_writable
+
+
+def get_generation() -> int:
+    """
+    Return current generation of models and data, shared by all worker processes.
+    Cached responses are keyed by it, see cache.make_cache_key.
+    """
+    try:
+        with open(config.CACHE_GENERATION_PATH) as f:
+            return int(f.read() or 0)
+    except FileNotFoundError:
+        return 0
+
+
+def bump_generation() -> int:
+    """
+    Start a new generation, so responses cached by any worker for previous models
+    and data are not served anymore. Called after retraining and erasing.
+
+    :return: New generation.
+    """
+    ensure_directory_exists_and_writable(config.CACHE_DIR)
+    with open(f"{config.CACHE_GENERATION_PATH}.lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        generation = get_generation() + 1
+        atomic_write(config.CACHE_GENERATION_PATH, str(generation))
+    return generation
@@ -0,0 +1,250 @@
+import json
+import os
+import threading
+from typing import Any, Optional
+
+import numpy as np
+import pandas as pd
+
+import config
+from services.metrics import timed
+from services.tools import atomic_write, slugify
+
+# Columnar data file: magic, header length, JSON header, then column arrays.
+# Columns are aligned, so they are memory-mapped directly without parsing or copying.
+COLUMNAR_MAGIC = b"CPICOLS1"
+COLUMNAR_ALIGNMENT = 64
+
+
+class ProductData:
+    """
+    Long price data indexed by product slug.
+
+    Rows are sorted by product and date, so data of every product is a contiguous
+    slice of the `dates` and `prices` arrays, bounded by `offsets`.
+    Instances are never modified after creation and are safe to share between threads.
+    """
+
+    def __init__(
+        self,
+        products: list[str],
+        dates: np.ndarray,
+        prices: np.ndarray,
+        offsets: np.ndarray,
+        version: Optional[tuple] = None,
+        slugs: Optional[list[str]] = None,
+    ):
+        """
+        :param products: Product names.
+        :param dates: Dates sorted by product and date.
+        :param prices: Prices in the same order as dates.
+        :param offsets: Start of each product's rows, followed by the number of rows.
+        :param version: Version of the source file the data was loaded from.
+        :param slugs: Slugified product names, computed when not given.
+        """
+        self.version = version
+        self.dates = dates
+        self.prices = prices
+        self.offsets = offsets
+        self.products = list(products)
+        if slugs is None:
+            slugs = [slugify(product) for product in self.products]
+        self.product_pairs = list(zip(self.products, slugs))
+        self.slug_index = {slug: i for i, slug in enumerate(slugs)}
+
+    @classmethod
+    def from_dataframe(
+        cls, df: pd.DataFrame, version: Optional[tuple] = None
+    ) -> "ProductData":
+        """
+        :param df: Long dataframe with "Product", "Date" and "Price" columns.
+        :param version: Version of the source file the data was loaded from.
+        """
+        # Products are kept in order of appearance, like in the source file
+        codes, products = pd.factorize(df["Product"])
+        order = np.lexsort((df["Date"].values, codes))
+        return cls(
+            products,
+            np.ascontiguousarray(df["Date"].values[order], dtype="datetime64[ns]"),
+            np.ascontiguousarray(df["Price"].values[order], dtype=np.float64),
+            np.searchsorted(codes[order], np.arange(len(products) + 1)),
+            version,
+        )
+
+    @property
+    def product_codes(self) -> np.ndarray:
+        """
+        Index of the product of every row.
+        """
+        return np.repeat(
+            np.arange(len(self.products), dtype=np.int32), np.diff(self.offsets)
+        )
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """
+        Long dataframe with categorical "Product" column, sorted by product and date.
+        """
+        return pd.DataFrame(
+            {
+                "Product": pd.Categorical.from_codes(
+                    self.product_codes, categories=self.products
+                ),
+                "Date": self.dates,
+                "Price": self.prices,
+            }
+        )
+
+    def get_product(self, product_slug: str) -> tuple[str, np.ndarray, np.ndarray]:
+        """
+        Get data for a product by its slug.
+
+        :param product_slug: Slugified product name.
+        :return: Original product name, sorted dates and prices.
+        """
+        i = self.slug_index.get(product_slug)
+        if i is None:
+            raise ValueError(f"No product found matching '{product_slug}'")
+        start, end = self.offsets[i], self.offsets[i + 1]
+        return self.products[i], self.dates[start:end], self.prices[start:end]
+
+    def last_points(self, product_slugs: list[str]) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Get last known date and price for each of the products.
+
+        :param product_slugs: Slugified product names.
+        :return: Arrays of dates and prices in the order of product_slugs.
+        """
+        missing = [slug for slug in product_slugs if slug not in self.slug_index]
+        if missing:
+            raise ValueError(f"No product found matching '{', '.join(missing)}'")
+        indices = np.array([self.slug_index[slug] for slug in product_slugs], dtype=int)
+        last_rows = self.offsets[indices + 1] - 1
+        return self.dates[last_rows], self.prices[last_rows]
+
+
+def save_price_data(df: pd.DataFrame, file_path: str) -> None:
+    """
+    Save long price data in the columnar format read by open_price_data.
+    The file is renamed into place, see atomic_write.
+
+    :param df: Long dataframe with "Product", "Date" and "Price" columns.
+    :param file_path: Path to the data file.
+    """
+    data = ProductData.from_dataframe(df)
+    columns = {
+        "dates": data.dates,
+        "prices": data.prices,
+        "offsets": data.offsets.astype(np.int64),
+    }
+
+    layout, position = {}, 0
+    for name, array in columns.items():
+        layout[name] = {
+            "dtype": array.dtype.str,
+            "shape": list(array.shape),
+            "offset": position,
+        }
+        position += -(-array.nbytes // COLUMNAR_ALIGNMENT) * COLUMNAR_ALIGNMENT
+
+    header = json.dumps(
+        {
+            "products": data.products,
+            "slugs": [slug for _, slug in data.product_pairs],
+            "columns": layout,
+        },
+        ensure_ascii=False,
+    ).encode()
+    data_start = len(COLUMNAR_MAGIC) + 8 + len(header)
+    data_start = -(-data_start // COLUMNAR_ALIGNMENT) * COLUMNAR_ALIGNMENT
+
+    def write(f):
+        f.write(COLUMNAR_MAGIC)
+        f.write(len(header).to_bytes(8, "little"))
+        f.write(header)
+        for name, array in columns.items():
+            f.seek(data_start + layout[name]["offset"])
+            f.write(array.tobytes())
+        f.truncate(data_start + position)
+
+    atomic_write(file_path, write)
+
+
+def open_price_data(file_path: str, version: Optional[tuple] = None) -> ProductData:
+    """
+    Open long price data saved by save_price_data.
+    Arrays are read-only memory maps of the file: nothing is parsed or copied,
+    pages are loaded on access and shared between processes.
+
+    :param file_path: Path to the data file.
+    :param version: Version of the file, see get_product_data.
+    """
+    with open(file_path, "rb") as f:
+        if f.read(len(COLUMNAR_MAGIC)) != COLUMNAR_MAGIC:
+            raise ValueError(f"'{file_path}' is not a columnar price data file")
+        header_size = int.from_bytes(f.read(8), "little")
+        header: dict[str, Any] = json.loads(f.read(header_size))
+    data_start = len(COLUMNAR_MAGIC) + 8 + header_size
+    data_start = -(-data_start // COLUMNAR_ALIGNMENT) * COLUMNAR_ALIGNMENT
+
+    columns = {}
+    for name, column in header["columns"].items():
+        shape = tuple(column["shape"])
+        if shape[0] == 0:
+            columns[name] = np.empty(shape, dtype=column["dtype"])
+            continue
+        columns[name] = np.memmap(
+            file_path,
+            dtype=np.dtype(column["dtype"]),
+            mode="r",
+            offset=data_start + column["offset"],
+            shape=shape,
+        )
+    return ProductData(
+        header["products"],
+        columns["dates"],
+        columns["prices"],
+        columns["offsets"],
+        version,
+        header["slugs"],
+    )
+
+
+def read_price_data(file_path: str = None) -> pd.DataFrame:
+    """
+    Read long price data as a dataframe with categorical "Product" column.
+
+    :param file_path: Path to the data file, DATA_COLUMNS_PATH from config.py by default.
+    """
+    return open_price_data(file_path or config.DATA_COLUMNS_PATH).to_dataframe()
+
+
+_product_data: Optional[ProductData] = None
+_product_data_lock = threading.Lock()
+
+
+def _file_version(file_path: str) -> tuple[int, int]:
+    stat = os.stat(file_path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+@timed("data")
+def get_product_data() -> ProductData:
+    """
+    Return process-wide product data. The data file is memory-mapped once and
+    reopened only when its mtime or size changes, e.g. after models are retrained.
+    """
+    global _product_data
+
+    version = _file_version(config.DATA_COLUMNS_PATH)
+    product_data = _product_data
+    if product_data is not None and product_data.version == version:
+        return product_data
+
+    with _product_data_lock:
+        if _product_data is None or _product_data.version != version:
+            _product_data = open_price_data(config.DATA_COLUMNS_PATH, version)
+            print(
+                f"Loaded {len(_product_data.prices)} rows for "
+                f"{len(_product_data.products)} products"
+            )  # logger.info
+        return _product_data
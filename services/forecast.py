@@ -1,92 +1,173 @@
 import io
-import os
-import pickle
 
-import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
-from matplotlib.ticker import MaxNLocator
-from sklearn.metrics import mean_squared_error
 
 import config
-from config import MODELS_DIR
+from services.data_store import get_product_data
+from services.forecaster import model_file_path
+from services.metrics import timed
+from services.model_registry import model_registry
 from services.tools import slugify
 
 
+@timed("data")
 def load_data(product_name: str) -> pd.DataFrame:
     """
-    From csv with all data get data for product_name
+    Get data sorted by date for product_name from the in-memory data store
+
+    :param product_name: Slugified product name.
     """
-    data = pd.read_csv(config.DATA_FILE_PATH)
-    product_mapping = {slugify(prod): prod for prod in data["Product"].unique()}
-    original_product_name = product_mapping.get(product_name)
-    if original_product_name is None:
-        raise ValueError(f"No product found matching '{product_name}'")
-    product_data = data[data["Product"] == original_product_name].sort_values(by="Date")
-    return product_data
+    original_product_name, dates, prices = get_product_data().get_product(product_name)
+    return pd.DataFrame(
+        {"Product": original_product_name, "Date": dates, "Price": prices}
+    )
 
 
 def constrain_forecast(original, forecast, max_change=0.05) -> list:
     """
     Limit predictions to a certain threshold
     """
-    constrained = [original.iloc[-1]]
-    for f in forecast:
-        change = (f - constrained[-1]) / constrained[-1]
-        if abs(change) > max_change:
-            new_value = constrained[-1] * (1 + max_change * np.sign(change))
-        else:
-            new_value = f
-        constrained.append(new_value)
-    return constrained[1:]
+    last_value = np.asarray(original)[-1:]
+    forecast = np.asarray(forecast, dtype=np.float64)[None, :]
+    return constrain_forecasts(last_value, forecast, max_change)[0].tolist()
+
+
+def constrain_forecasts(
+    last_values: np.ndarray, forecasts: np.ndarray, max_change: float = 0.05
+) -> np.ndarray:
+    """
+    Limit change of each predicted value relative to the previous constrained one.
+    Every step depends on the previous one, so steps are processed in a loop,
+    but all products are processed at once.
 
+    :param last_values: Last known value of each product, shape (products,).
+    :param forecasts: Forecasts, shape (products, horizon).
+    :param max_change: Max relative change between two steps.
+    :return: Constrained forecasts, shape (products, horizon).
+    """
+    forecasts = np.asarray(forecasts, dtype=np.float64)
+    constrained = np.empty_like(forecasts)
+    previous = np.asarray(last_values, dtype=np.float64)
+
+    if len(forecasts) == 1:
+        # For a single product plain floats are faster than arrays of one element
+        value = float(previous[0])
+        for step, forecast in enumerate(forecasts[0].tolist()):
+            change = (forecast - value) / value
+            if abs(change) > max_change:
+                value = value * (1 + max_change * (1.0 if change > 0 else -1.0))
+            else:
+                value = forecast
+            constrained[0, step] = value
+        return constrained
+
+    for step in range(forecasts.shape[1]):
+        forecast = forecasts[:, step]
+        change = (forecast - previous) / previous
+        previous = np.where(
+            np.abs(change) > max_change,
+            previous * (1 + max_change * np.sign(change)),
+            forecast,
+        )
+        constrained[:, step] = previous
+    return constrained
 
+
+@timed("model")
 def get_model_dict(product_name: str) -> dict:
     """
-    Load model from disk and return it as a dictionary
+    Get model with its metadata as a dictionary.
+    Models are loaded from disk once and then served from the in-memory registry.
     """
-    model_filename = f"{slugify(product_name)}.pkl"
-    model_path = os.path.join(MODELS_DIR, model_filename)
-    with open(model_path, "rb") as f:
-        model = pickle.load(f)
-    return model
+    model_path = model_file_path(config.MODELS_DIR, slugify(product_name))
+    # Copy, so callers can modify metadata without changing the cached one
+    return dict(model_registry.get(model_path))
 
 
+@timed("rmse")
 def calculate_rmse(model, data) -> float:
     in_sample_forecast = model.fittedvalues
     min_length = min(len(data["Price"]), len(in_sample_forecast))
-    return mean_squared_error(
-        data["Price"][-min_length:], in_sample_forecast[-min_length:], squared=False
+    errors = np.asarray(data["Price"][-min_length:]) - np.asarray(
+        in_sample_forecast[-min_length:]
     )
+    return np.sqrt(np.mean(errors**2))
+
 
+# Figure size in inches, resolution and font size of the metrics box
+PLOT_PRESETS = {
+    "default": {"figsize": (14, 7), "dpi": 100, "fontsize": 15},
+    "compact": {"figsize": (10, 5), "dpi": 80, "fontsize": 12},
+    "thumbnail": {"figsize": (7, 3.5), "dpi": 60, "fontsize": 9},
+}
+PLOT_FORMATS = {"png": "image/png", "svg": "image/svg+xml", "webp": "image/webp"}
 
+_METRICS_BOX_STYLE = dict(boxstyle="round", facecolor="white", alpha=0.8)
+
+
+@timed("plot")
 def create_forecast_plot(
-    data, forecast_dates, forecast, product_name, train_mae, test_mae, rmse
+    data,
+    forecast_dates,
+    forecast,
+    product_name,
+    train_mae,
+    test_mae,
+    rmse,
+    preset: str = "default",
+    fmt: str = "png",
 ) -> io.BytesIO:
-    plt.figure(figsize=(14, 7))
-    plt.plot(data["Date"], data["Price"], label="Historical Data", marker="o")
-    plt.plot(forecast_dates, forecast, label="Forecast", linestyle="--", marker="o")
-    plt.axhline(y=100, color="g", linestyle="--", label="100%")
-    plt.legend()
-    plt.title(f"Price Forecast for {product_name}")
-    plt.xlabel("Date")
-    plt.ylabel("Price Index")
-    plt.grid(True)
-    plt.xticks(rotation=45)
-    plt.gca().xaxis.set_major_locator(MaxNLocator(integer=True))
-    plt.gca().yaxis.set_major_locator(MaxNLocator(integer=True))
-    plt.text(
+    """
+    Render forecast plot. Uses its own figure and Agg canvas instead of the global
+    pyplot state, so plots can be rendered from several threads at once.
+
+    :param preset: Size preset, one of PLOT_PRESETS.
+    :param fmt: Image format, one of PLOT_FORMATS.
+    """
+    # Imported on first use, most requests are served with pre-rendered plots
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+    from matplotlib.ticker import MaxNLocator
+
+    preset = PLOT_PRESETS[preset]
+    if fmt not in PLOT_FORMATS:
+        raise ValueError(f"Unsupported plot format '{fmt}'")
+
+    fig = Figure(figsize=preset["figsize"], dpi=preset["dpi"])
+    canvas = FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    ax.plot(data["Date"], data["Price"], label="Historical Data", marker="o")
+    ax.plot(forecast_dates, forecast, label="Forecast", linestyle="--", marker="o")
+    ax.axhline(y=100, color="g", linestyle="--", label="100%")
+    ax.legend()
+    ax.set_title(f"Price Forecast for {product_name}")
+    ax.set_xlabel("Date")
+    ax.set_ylabel("Price Index")
+    ax.grid(True)
+    for label in ax.get_xticklabels():
+        label.set_rotation(45)
+    ax.xaxis.set_major_locator(MaxNLocator(integer=True))
+    ax.yaxis.set_major_locator(MaxNLocator(integer=True))
+    ax.text(
         0.02,
         0.98,
         f"Train MAE: {train_mae:.2f}\nTest MAE: {test_mae:.2f}\nRMSE: {rmse:.2f}",
-        transform=plt.gca().transAxes,
+        transform=ax.transAxes,
         verticalalignment="top",
-        fontsize=15,
-        bbox=dict(boxstyle="round", facecolor="white", alpha=0.8),
+        fontsize=preset["fontsize"],
+        bbox=_METRICS_BOX_STYLE,
     )
-    plt.tight_layout()
+    fig.tight_layout()
+
     buf = io.BytesIO()
-    plt.savefig(buf, format="png")
+    if fmt == "webp":
+        # Pillow is a dependency of matplotlib, encode the rendered buffer with it
+        from PIL import Image
+
+        canvas.draw()
+        Image.fromarray(np.asarray(canvas.buffer_rgba())).save(buf, format="WEBP")
+    else:
+        fig.savefig(buf, format=fmt)
     buf.seek(0)
-    plt.close()
     return buf
@@ -0,0 +1,158 @@
+import json
+import os
+import threading
+from typing import Any, Optional
+
+import numpy as np
+
+import config
+from services.batch_forecast import forecast_dates, get_forecast_engine
+from services.data_store import get_product_data
+from services.forecast import calculate_rmse, constrain_forecasts
+from services.forecaster import model_file_path
+from services.metrics import timed
+from services.model_registry import model_registry
+from services.tools import atomic_write
+
+# 95% confidence interval, same as in make_forecast
+CI_CRITICAL_VALUE = 1.96
+
+
+def _forecast_rows(
+    slugs: list[str],
+    forecasts: np.ndarray,
+    model_dicts: list[dict[str, Any]],
+    horizon: int,
+) -> dict[str, dict[str, Any]]:
+    product_data = get_product_data()
+    last_dates, last_prices = product_data.last_points(slugs)
+    dates = np.datetime_as_string(forecast_dates(last_dates, horizon), unit="D")
+    constrained = constrain_forecasts(last_prices, forecasts)
+
+    residual_mse = np.array(
+        [model_dict.get("residual_mse", np.nan) for model_dict in model_dicts]
+    )
+    standard_error = np.sqrt(
+        residual_mse[:, None] * (1 + np.arange(1, horizon + 1))[None, :]
+    )
+    lower_ci = forecasts - CI_CRITICAL_VALUE * standard_error
+    upper_ci = forecasts + CI_CRITICAL_VALUE * standard_error
+
+    rows = {}
+    for i, (slug, model_dict) in enumerate(zip(slugs, model_dicts)):
+        _, _, prices = product_data.get_product(slug)
+        rows[slug] = {
+            "product_name": model_dict["product_name"],
+            "dates": dates[i].tolist(),
+            "forecast": forecasts[i].tolist(),
+            "constrained_forecast": constrained[i].tolist(),
+            "lower_ci": lower_ci[i].tolist(),
+            "upper_ci": upper_ci[i].tolist(),
+            "rmse": float(calculate_rmse(model_dict["model"], {"Price": prices})),
+            "train_mae": model_dict["train_mae"],
+            "test_mae": model_dict["test_mae"],
+        }
+    return rows
+
+
+def compute_forecast_rows(
+    product_slugs: Optional[list[str]] = None,
+    horizon: int = config.FORECAST_HORIZON,
+) -> dict[str, dict[str, Any]]:
+    """
+    Compute everything needed to serve forecasts: dates, raw and constrained
+    forecasts, confidence interval bounds, RMSE and model errors.
+
+    :param product_slugs: Slugs of products, by default all products having both
+        data and model.
+    :param horizon: Forecast horizon in weeks.
+    :return: Rows by product slug.
+    """
+    engine = get_forecast_engine()
+    if product_slugs is None:
+        slug_index = get_product_data().slug_index
+        product_slugs = [slug for slug in engine.models if slug in slug_index]
+
+    slugs, forecasts = engine.forecast(horizon, product_slugs)
+    return _forecast_rows(
+        slugs, forecasts, [engine.models[slug] for slug in slugs], horizon
+    )
+
+
+def compute_forecast_row(
+    product_slug: str, horizon: int = config.FORECAST_HORIZON
+) -> dict[str, Any]:
+    """
+    Compute the serving row of one product, see compute_forecast_rows. The model
+    is taken from the model registry, models of other products are not loaded.
+
+    :param product_slug: Slugified product name.
+    :param horizon: Forecast horizon in weeks.
+    """
+    try:
+        model_dict = model_registry.get(
+            model_file_path(config.MODELS_DIR, product_slug)
+        )
+    except FileNotFoundError:
+        raise ValueError(f"No models found for {product_slug}")
+    forecasts = np.asarray(model_dict["model"].forecast(horizon))[None, :]
+    return _forecast_rows([product_slug], forecasts, [model_dict], horizon)[
+        product_slug
+    ]
+
+
+def build_forecast_table(horizon: int = config.FORECAST_HORIZON) -> str:
+    """
+    Compute forecasts for all products and save them to the serving table.
+
+    :param horizon: Forecast horizon in weeks.
+    :return: Path to the table file.
+    """
+    rows = compute_forecast_rows(horizon=horizon)
+    path = config.FORECASTS_FILE_PATH
+    atomic_write(path, json.dumps(rows, ensure_ascii=False))
+    print(f"Forecasts for {len(rows)} products saved to {path}")  # logger.info
+    return path
+
+
+_table: Optional[dict[str, Any]] = None
+_table_version: Optional[tuple[int, int]] = None
+_table_lock = threading.Lock()
+
+
+def load_forecast_table() -> Optional[dict[str, Any]]:
+    """
+    Return the serving table, reloaded when the file changes, or None if it is not built.
+    """
+    global _table, _table_version
+
+    try:
+        stat = os.stat(config.FORECASTS_FILE_PATH)
+    except FileNotFoundError:
+        return None
+    version = (stat.st_mtime_ns, stat.st_size)
+    if version == _table_version:
+        return _table
+
+    with _table_lock:
+        if version != _table_version:
+            with open(config.FORECASTS_FILE_PATH) as f:
+                _table = json.load(f)
+            _table_version = version
+        return _table
+
+
+@timed("forecast")
+def get_forecast_row(product_slug: str) -> dict[str, Any]:
+    """
+    Get precomputed forecast for a product from the serving table.
+    The table of previous models is served while models are retrained, until
+    the new one replaces it. If the product is not in the table, e.g. it is new,
+    the forecast is computed from its model.
+
+    :param product_slug: Slugified product name.
+    """
+    table = load_forecast_table()
+    if table is not None and product_slug in table:
+        return table[product_slug]
+    return compute_forecast_row(product_slug)
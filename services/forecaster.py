@@ -0,0 +1,211 @@
+import json
+import os
+from datetime import datetime
+from typing import Any, Optional
+
+import numpy as np
+
+from config import MODEL_FILE_EXTENSION
+from services.tools import atomic_write
+
+MODEL_FORMAT_VERSION = 1
+
+
+class HoltWintersForecaster:
+    """
+    Lightweight Holt-Winters forecaster built from the final states of a fitted
+    statsmodels model. Produces the same forecast as HoltWintersResults.forecast
+    using only NumPy, so statsmodels is not needed to serve forecasts.
+    """
+
+    def __init__(
+        self,
+        level: float,
+        trend_state: float,
+        seasonal_states: np.ndarray,
+        fittedvalues: np.ndarray,
+        trend: Optional[str] = "add",
+        seasonal: Optional[str] = "add",
+        damping_trend: float = 1.0,
+        params: Optional[dict[str, Any]] = None,
+    ):
+        """
+        :param level: Level after the last observation.
+        :param trend_state: Trend after the last observation, not damped.
+        :param seasonal_states: Seasonal components used for the next seasonal_periods
+            steps, rotated so that the one for step h is seasonal_states[h % m].
+        :param fittedvalues: In-sample one-step-ahead predictions.
+        :param trend: "add", "mul" or None.
+        :param seasonal: "add", "mul" or None.
+        :param damping_trend: Damping factor phi, 1.0 if trend is not damped.
+        :param params: Smoothing parameters and initial states of the fitted model.
+        """
+        self.level = float(level)
+        self.trend_state = float(trend_state)
+        self.seasonal_states = np.asarray(seasonal_states, dtype=np.float64)
+        self.fittedvalues = np.asarray(fittedvalues, dtype=np.float64)
+        self.trend = trend
+        self.seasonal = seasonal
+        self.damping_trend = float(damping_trend)
+        self.params = params or {}
+
+    @property
+    def damped(self) -> bool:
+        return self.damping_trend != 1.0
+
+    @property
+    def seasonal_periods(self) -> int:
+        return len(self.seasonal_states)
+
+    @classmethod
+    def from_results(cls, model_fit) -> "HoltWintersForecaster":
+        """
+        Create forecaster from statsmodels HoltWintersResults.
+        """
+        model = model_fit.model
+        params = model_fit.params
+        if params["use_boxcox"] or params["remove_bias"]:
+            raise ValueError("Box-Cox transform and bias removal are not supported")
+
+        # Forecasts are computed by statsmodels from params rather than from
+        # the fitted states, which differ for damped multiplicative trend.
+        # Get the states the same way.
+        states = model._predict(h=0, **params)
+
+        seasonal_states = np.empty(0)
+        if model.has_seasonal:
+            m = model.seasonal_periods
+            # statsmodels forecasts step h with season[-m - 1 + h % m]
+            seasonal_states = np.asarray(states.season)[-m - 1 : -1]
+
+        return cls(
+            level=np.asarray(states.level)[-1],
+            trend_state=np.asarray(states.trend)[-1] if model.has_trend else 0.0,
+            seasonal_states=seasonal_states,
+            fittedvalues=np.asarray(model_fit.fittedvalues),
+            trend=model.trend,
+            seasonal=model.seasonal,
+            damping_trend=params["damping_trend"] if model.damped_trend else 1.0,
+            params={
+                "smoothing_level": params["smoothing_level"],
+                "smoothing_trend": params["smoothing_trend"],
+                "smoothing_seasonal": params["smoothing_seasonal"],
+                "damping_trend": (
+                    params["damping_trend"] if model.damped_trend else None
+                ),
+                "initial_level": params["initial_level"],
+                "initial_trend": params["initial_trend"],
+                "initial_seasons": np.asarray(params["initial_seasons"]).tolist(),
+            },
+        )
+
+    def start_params(self) -> np.ndarray:
+        """
+        Fitted parameters in the order of ExponentialSmoothing.fit(start_params=...),
+        used to warm-start a refit of the same kind of model on extended data.
+        """
+        params = self.params
+        start_params = [params["smoothing_level"]]
+        if self.trend:
+            start_params.append(params["smoothing_trend"])
+        if self.seasonal:
+            start_params.append(params["smoothing_seasonal"])
+        start_params.append(params["initial_level"])
+        if self.trend:
+            start_params.append(params["initial_trend"])
+        if self.damped:
+            start_params.append(params["damping_trend"])
+        if self.seasonal:
+            start_params.extend(params["initial_seasons"])
+        return np.array(start_params, dtype=np.float64)
+
+    def forecast(self, steps: int = 1) -> np.ndarray:
+        """
+        Out-of-sample forecast for the given number of steps.
+        """
+        h = np.arange(1, steps + 1)
+        if self.damped:
+            phi_h = np.cumsum(self.damping_trend**h)
+        else:
+            phi_h = h.astype(np.float64)
+
+        if self.trend == "add":
+            forecast = self.level + self.trend_state * phi_h
+        elif self.trend == "mul":
+            forecast = self.level * self.trend_state**phi_h
+        else:
+            forecast = np.full(steps, self.level)
+
+        if self.seasonal:
+            season = self.seasonal_states[h % self.seasonal_periods]
+            if self.seasonal == "add":
+                forecast = forecast + season
+            else:
+                forecast = forecast * season
+        return forecast
+
+
+def model_file_path(models_dir: str, product_slug: str) -> str:
+    return os.path.join(models_dir, f"{product_slug}{MODEL_FILE_EXTENSION}")
+
+
+def save_model_artifact(path: str, model_metadata: dict[str, Any]) -> None:
+    """
+    Save forecaster and model metadata to a compact .npz file.
+    The file is renamed into place, see atomic_write.
+
+    :param path: Path to model file.
+    :param model_metadata: Dictionary with HoltWintersForecaster in "model" key.
+    """
+    model = model_metadata["model"]
+    metadata = {k: v for k, v in model_metadata.items() if k != "model"}
+    metadata["date_created"] = metadata["date_created"].isoformat()
+
+    spec = {
+        "trend": model.trend,
+        "seasonal": model.seasonal,
+        "damping_trend": model.damping_trend,
+        "params": model.params,
+    }
+
+    atomic_write(
+        path,
+        lambda f: np.savez(
+            f,
+            format_version=np.array(MODEL_FORMAT_VERSION),
+            level=np.array(model.level),
+            trend_state=np.array(model.trend_state),
+            seasonal_states=model.seasonal_states,
+            fittedvalues=model.fittedvalues,
+            spec=np.array(json.dumps(spec)),
+            metadata=np.array(json.dumps(metadata, ensure_ascii=False)),
+        ),
+    )
+
+
+def load_model_artifact(path: str) -> dict[str, Any]:
+    """
+    Load model saved with save_model_artifact.
+
+    :param path: Path to model file.
+    :return: Model metadata with HoltWintersForecaster in "model" key.
+    """
+    with np.load(path, allow_pickle=False) as artifact:
+        format_version = int(artifact["format_version"])
+        if format_version != MODEL_FORMAT_VERSION:
+            raise ValueError(
+                f"Unsupported model format version {format_version} in '{path}'"
+            )
+        spec = json.loads(str(artifact["spec"]))
+        model_metadata = json.loads(str(artifact["metadata"]))
+        model_metadata["model"] = HoltWintersForecaster(
+            level=artifact["level"],
+            trend_state=artifact["trend_state"],
+            seasonal_states=artifact["seasonal_states"],
+            fittedvalues=artifact["fittedvalues"],
+            **spec,
+        )
+    model_metadata["date_created"] = datetime.fromisoformat(
+        model_metadata["date_created"]
+    )
+    return model_metadata
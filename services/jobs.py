@@ -0,0 +1,189 @@
+import fcntl
+import json
+import os
+import queue
+import threading
+import time
+import traceback
+import uuid
+from typing import Any, Callable, Optional
+
+import config
+from services.tools import (
+    atomic_write,
+    ensure_directory_exists_and_writable,
+    is_process_alive,
+    process_start_time,
+)
+
+_job_queue: "queue.Queue[tuple[str, Callable, dict]]" = queue.Queue()
+_worker: Optional[threading.Thread] = None
+_worker_lock = threading.Lock()
+
+
+def _job_path(job_id: str) -> str:
+    return os.path.join(config.JOBS_DIR, f"{job_id}.json")
+
+
+def _write_job(job: dict[str, Any]) -> None:
+    atomic_write(_job_path(job["id"]), json.dumps(job, ensure_ascii=False))
+
+
+def get_job(job_id: str) -> Optional[dict[str, Any]]:
+    """
+    Read job state from disk and add elapsed time and ETA.
+
+    :param job_id: Job id returned by submit_job.
+    :return: Job state or None if there is no such job.
+    """
+    # Job ids are hex uuids, anything else can't be a job file
+    if not job_id.isalnum():
+        return None
+    try:
+        with open(_job_path(job_id)) as f:
+            job = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+    # The pid may be reused by another process, e.g. after a container restart
+    if job["status"] in ("queued", "running") and not is_process_alive(
+        job["pid"], job.get("pid_start_time")
+    ):
+        job["status"] = "failed"
+        job["error"] = "Worker process exited before the job was finished"
+        job["finished_at"] = time.time()
+
+    now = job["finished_at"] or time.time()
+    job["elapsed_seconds"] = now - job["started_at"] if job["started_at"] else 0.0
+
+    job["eta_seconds"] = None
+    done, total = job["progress"]["done"], job["progress"]["total"]
+    if job["status"] == "running" and job["stage_started_at"] and done and total:
+        stage_elapsed = time.time() - job["stage_started_at"]
+        job["eta_seconds"] = stage_elapsed / done * (total - done)
+    return job
+
+
+def list_jobs(limit: int = 20) -> list[dict[str, Any]]:
+    """
+    Return the most recent jobs, newest first.
+    """
+    if not os.path.isdir(config.JOBS_DIR):
+        return []
+    job_files = [f for f in os.listdir(config.JOBS_DIR) if f.endswith(".json")]
+    job_files.sort(
+        key=lambda f: os.path.getmtime(os.path.join(config.JOBS_DIR, f)), reverse=True
+    )
+    jobs = [get_job(f[: -len(".json")]) for f in job_files[:limit]]
+    return [job for job in jobs if job is not None]
+
+
+class JobProgress:
+    """
+    Progress reporter passed to the job target. Persists every update to the job file.
+    """
+
+    def __init__(self, job: dict[str, Any]):
+        self.job = job
+
+    def __call__(
+        self, stage: str, done: Optional[int] = None, total: Optional[int] = None
+    ) -> None:
+        """
+        :param stage: Name of current pipeline stage, e.g. "downloading" or "training".
+        :param done: Number of processed items in the stage.
+        :param total: Total number of items in the stage.
+        """
+        if stage != self.job["stage"]:
+            self.job["stage"] = stage
+            self.job["stage_started_at"] = time.time()
+            print(f"Job {self.job['id']}: {stage}")  # logger.info
+        self.job["progress"] = {"done": done, "total": total}
+        _write_job(self.job)
+
+
+def _run_job(job_id: str, target: Callable, kwargs: dict[str, Any]) -> None:
+    with open(_job_path(job_id)) as f:
+        job = json.load(f)
+    progress = JobProgress(job)
+
+    # Only one job at a time on the host, even if it was submitted to another worker
+    with open(os.path.join(config.JOBS_DIR, "jobs.lock"), "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        job["status"] = "running"
+        job["started_at"] = time.time()
+        _write_job(job)
+        try:
+            job["result"] = target(progress=progress, **kwargs)
+            job["status"] = "succeeded"
+            job["stage"] = "done"
+        except Exception as e:
+            traceback.print_exc()
+            job["status"] = "failed"
+            job["error"] = str(e)
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    job["finished_at"] = time.time()
+    _write_job(job)
+    print(f"Job {job_id} {job['status']}")  # logger.info
+
+
+def _worker_loop() -> None:
+    while True:
+        job_id, target, kwargs = _job_queue.get()
+        try:
+            _run_job(job_id, target, kwargs)
+        except Exception:
+            # Never let the worker thread die, the next job must still run
+            traceback.print_exc()
+        finally:
+            _job_queue.task_done()
+
+
+def _ensure_worker() -> None:
+    """
+    Start the worker thread on first use. It is not started on import, because
+    threads don't survive the fork of gunicorn workers.
+    """
+    global _worker
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(
+                target=_worker_loop, name="job-worker", daemon=True
+            )
+            _worker.start()
+
+
+def submit_job(kind: str, target: Callable, **kwargs) -> str:
+    """
+    Queue a function to be executed in the background worker of this process.
+
+    :param kind: Job type, e.g. "training". Reported in the job state.
+    :param target: Function to execute. Must accept `progress` keyword argument
+        and return JSON serializable result.
+    :param kwargs: Keyword arguments for target.
+    :return: Job id.
+    """
+    ensure_directory_exists_and_writable(config.JOBS_DIR)
+
+    job = {
+        "id": uuid.uuid4().hex,
+        "kind": kind,
+        "status": "queued",
+        "stage": "queued",
+        "progress": {"done": None, "total": None},
+        "pid": os.getpid(),
+        "pid_start_time": process_start_time(os.getpid()),
+        "created_at": time.time(),
+        "started_at": None,
+        "stage_started_at": None,
+        "finished_at": None,
+        "result": None,
+        "error": None,
+    }
+    _write_job(job)
+
+    _ensure_worker()
+    _job_queue.put((job["id"], target, kwargs))
+    return job["id"]
@@ -0,0 +1,445 @@
+import cProfile
+import fcntl
+import glob
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from functools import wraps
+from typing import Any, Callable, Optional
+
+from flask import Flask, Response, g, has_request_context, request
+
+import config
+from services.tools import atomic_write, is_process_alive, process_start_time
+
+# Upper bounds of latency histogram buckets in seconds
+LATENCY_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+)
+
+# Metrics of a process are written to its file at most once in this many seconds
+FLUSH_INTERVAL = 1.0
+
+# Counters and histograms of exited processes are folded into this file by /metrics
+EXITED_FILE_NAME = "exited.json"
+
+# Counters of the model registry exported as metrics
+_REGISTRY_COUNTERS = ("hits", "misses", "evictions")
+
+# Type and help of exported metrics
+METRICS = {
+    "http_request_duration_seconds": (
+        "histogram",
+        "Request latency by endpoint, method and status",
+    ),
+    "span_duration_seconds": (
+        "histogram",
+        "Time spent in request stages: data, model, forecast, rmse and plot",
+    ),
+    "response_cache_requests_total": (
+        "counter",
+        "Lookups of the response cache by endpoint and result",
+    ),
+    "plot_cache_requests_total": (
+        "counter",
+        "Lookups of rendered plots by result, plots are rendered on miss",
+    ),
+    "model_loads_total": (
+        "counter",
+        "Models loaded from disk by the model registry and the forecast engine",
+    ),
+    "model_registry_requests_total": ("counter", "Lookups of the model registry"),
+    "model_registry_evictions_total": ("counter", "Models evicted from the registry"),
+    "model_registry_models": ("gauge", "Models in the registry of a worker"),
+    "model_registry_bytes": ("gauge", "Size of models in the registry of a worker"),
+}
+
+
+class MetricsStore:
+    """
+    Counters and histograms of this process. Every process writes them to its own
+    file in METRICS_DIR, and /metrics merges the files of all gunicorn workers,
+    so no external service is needed.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self) -> None:
+        """
+        Start from zero with a new file, e.g. in a worker forked from the master,
+        so metrics of the master are not counted by every worker. Locks are
+        replaced too, they may be held by another thread of the parent at fork.
+        """
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._flush_timer: Optional[threading.Timer] = None
+        self.counters: dict[tuple, float] = {}
+        self.histograms: dict[tuple, list] = {}
+        # Files are named by the identity of the process, pids alone are reused
+        self.pid = os.getpid()
+        self.start_time = process_start_time(self.pid)
+        self.file_name = f"{self.pid}-{self.start_time or time.time_ns()}.json"
+        self._flushed_at = 0.0
+        # Registry counters inherited from the parent are subtracted
+        self._registry_base = self._registry_counters()
+
+    @staticmethod
+    def _registry_counters() -> dict[str, int]:
+        # Read without the lock of the registry, it may be held at fork
+        registry_module = sys.modules.get("services.model_registry")
+        if registry_module is None:
+            return dict.fromkeys(_REGISTRY_COUNTERS, 0)
+        registry = registry_module.model_registry
+        return {name: getattr(registry, name) for name in _REGISTRY_COUNTERS}
+
+    def inc(self, name: str, value: float = 1.0, **labels) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0.0) + value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                # Count of every bucket, then sum and count of observations
+                histogram = self.histograms[key] = [0] * len(LATENCY_BUCKETS) + [0.0, 0]
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if value <= bound:
+                    histogram[i] += 1
+                    break
+            histogram[-2] += value
+            histogram[-1] += 1
+
+    def snapshot(self) -> dict[str, Any]:
+        """
+        JSON serializable state, including counters of the model registry.
+        """
+        # Imported here, the registry is imported by modules using this one
+        from services.model_registry import model_registry
+
+        stats = model_registry.stats()
+        for name in _REGISTRY_COUNTERS:
+            stats[name] -= self._registry_base[name]
+        with self._lock:
+            counters = [
+                [name, labels, value] for (name, labels), value in self.counters.items()
+            ]
+            histograms = [
+                [name, labels, histogram]
+                for (name, labels), histogram in self.histograms.items()
+            ]
+        counters += [
+            ["model_loads_total", [["source", "registry"]], stats["misses"]],
+            ["model_registry_requests_total", [["result", "hit"]], stats["hits"]],
+            ["model_registry_requests_total", [["result", "miss"]], stats["misses"]],
+            ["model_registry_evictions_total", [], stats["evictions"]],
+        ]
+        return {
+            "pid": self.pid,
+            "start_time": self.start_time,
+            "counters": counters,
+            "histograms": histograms,
+            "gauges": [
+                ["model_registry_models", [], stats["size"]],
+                ["model_registry_bytes", [], stats["bytes"]],
+            ],
+        }
+
+    def flush(self, force: bool = False) -> None:
+        """
+        Write metrics to the file of this process, renamed into place, so
+        /metrics never reads a partial file. Writes skipped within FLUSH_INTERVAL
+        of the previous one are done later by a timer, so metrics of an idle
+        worker are not left behind.
+        """
+        with self._flush_lock:
+            now = time.monotonic()
+            if not force and now - self._flushed_at < FLUSH_INTERVAL:
+                if self._flush_timer is None:
+                    self._flush_timer = threading.Timer(
+                        FLUSH_INTERVAL, self.flush, kwargs={"force": True}
+                    )
+                    self._flush_timer.daemon = True
+                    self._flush_timer.start()
+                return
+            self._flushed_at = now
+            self._flush_timer = None
+            path = os.path.join(config.METRICS_DIR, self.file_name)
+            try:
+                os.makedirs(config.METRICS_DIR, exist_ok=True)
+                atomic_write(path, json.dumps(self.snapshot()))
+            except OSError as e:
+                print(f"Metrics are not saved: {e}")  # logger.error
+
+
+metrics = MetricsStore()
+os.register_at_fork(after_in_child=metrics.reset)
+
+
+@contextmanager
+def span(name: str):
+    """
+    Add time spent in the block to the span of the current request, reported in
+    Server-Timing header and span_duration_seconds. Nested spans of the same
+    name are counted once, outside of requests nothing is recorded.
+    """
+    if not has_request_context() or name in g.setdefault("active_spans", set()):
+        yield
+        return
+    g.active_spans.add(name)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        g.active_spans.discard(name)
+        spans = g.setdefault("spans", {})
+        spans[name] = spans.get(name, 0.0) + time.perf_counter() - start
+
+
+def timed(name: str) -> Callable:
+    """
+    Decorator recording every call of the function in a span, see span.
+    """
+
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def count_request(name: str, **labels) -> None:
+    """
+    Count an event of the current request, events outside of requests, e.g. of
+    training jobs, are not counted.
+    """
+    if has_request_context():
+        metrics.inc(name, **labels)
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: list) -> str:
+    if not labels:
+        return ""
+    values = ",".join(f'{name}="{_escape(value)}"' for name, value in labels)
+    return f"{{{values}}}"
+
+
+def _read_snapshot(path: str) -> Optional[dict[str, Any]]:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+
+
+def _merge_snapshot(
+    snapshot: dict[str, Any],
+    counters: dict[tuple, float],
+    histograms: dict[tuple, list],
+) -> None:
+    for name, labels, value in snapshot["counters"]:
+        key = (name, tuple(map(tuple, labels)))
+        counters[key] = counters.get(key, 0.0) + value
+    for name, labels, histogram in snapshot["histograms"]:
+        key = (name, tuple(map(tuple, labels)))
+        merged = histograms.setdefault(key, [0] * len(histogram))
+        histograms[key] = [a + b for a, b in zip(merged, histogram)]
+
+
+def _is_snapshot_alive(snapshot: dict[str, Any]) -> bool:
+    # A worker of a restarted container may get the pid of an exited one
+    return is_process_alive(snapshot["pid"], snapshot.get("start_time"))
+
+
+def _fold_exited_processes() -> None:
+    """
+    Add counters and histograms of exited processes to EXITED_FILE_NAME and
+    remove their files, so the directory does not grow with every restarted
+    worker. Called with the lock of METRICS_DIR held.
+    """
+    exited_path = os.path.join(config.METRICS_DIR, EXITED_FILE_NAME)
+    counters: dict[tuple, float] = {}
+    histograms: dict[tuple, list] = {}
+    folded = []
+    for path in glob.glob(os.path.join(config.METRICS_DIR, "*.json")):
+        if path == exited_path:
+            continue
+        snapshot = _read_snapshot(path)
+        if snapshot is not None and not _is_snapshot_alive(snapshot):
+            _merge_snapshot(snapshot, counters, histograms)
+            folded.append(path)
+    if not folded:
+        return
+
+    exited = _read_snapshot(exited_path)
+    if exited is not None:
+        _merge_snapshot(exited, counters, histograms)
+    snapshot = {
+        "pid": None,
+        "counters": [
+            [name, labels, value] for (name, labels), value in counters.items()
+        ],
+        "histograms": [
+            [name, labels, histogram]
+            for (name, labels), histogram in histograms.items()
+        ],
+        "gauges": [],
+    }
+    atomic_write(exited_path, json.dumps(snapshot))
+    for path in folded:
+        os.unlink(path)
+
+
+def render_metrics() -> str:
+    """
+    Metrics of all worker processes in Prometheus text format. Counters and
+    histograms of exited processes are kept in EXITED_FILE_NAME, so totals never
+    decrease, gauges are reported only for running processes.
+    """
+    metrics.flush(force=True)
+    counters: dict[tuple, float] = {}
+    histograms: dict[tuple, list] = {}
+    gauges: dict[tuple, float] = {}
+    os.makedirs(config.METRICS_DIR, exist_ok=True)
+    # Files are read and folded by one worker at a time, so no file is counted
+    # twice or missed while it is folded
+    with open(os.path.join(config.METRICS_DIR, "metrics.lock"), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        _fold_exited_processes()
+        for path in glob.glob(os.path.join(config.METRICS_DIR, "*.json")):
+            snapshot = _read_snapshot(path)
+            if snapshot is None:
+                continue
+            _merge_snapshot(snapshot, counters, histograms)
+            if snapshot["pid"] is not None and _is_snapshot_alive(snapshot):
+                for name, labels, value in snapshot["gauges"]:
+                    key = (
+                        name,
+                        tuple(map(tuple, labels)) + (("pid", snapshot["pid"]),),
+                    )
+                    gauges[key] = value
+
+    samples: dict[str, list[str]] = {name: [] for name in METRICS}
+    for (name, labels), value in sorted(counters.items()):
+        samples[name].append(f"{name}{_format_labels(labels)} {value:g}")
+    for (name, labels), value in sorted(gauges.items()):
+        samples[name].append(f"{name}{_format_labels(labels)} {value:g}")
+    for (name, labels), histogram in sorted(histograms.items()):
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS, histogram):
+            cumulative += count
+            bucket_labels = list(labels) + [("le", f"{bound:g}")]
+            samples[name].append(
+                f"{name}_bucket{_format_labels(bucket_labels)} {cumulative}"
+            )
+        bucket_labels = list(labels) + [("le", "+Inf")]
+        samples[name].append(
+            f"{name}_bucket{_format_labels(bucket_labels)} {histogram[-1]}"
+        )
+        samples[name].append(f"{name}_sum{_format_labels(labels)} {histogram[-2]:g}")
+        samples[name].append(f"{name}_count{_format_labels(labels)} {histogram[-1]}")
+
+    lines = []
+    for name, (kind, description) in METRICS.items():
+        lines += [f"# HELP {name} {description}", f"# TYPE {name} {kind}"]
+        lines += samples[name]
+    return "\n".join(lines) + "\n"
+
+
+def _profiling_requested() -> bool:
+    return config.PROFILING and (
+        request.args.get("profile") == "1" or request.headers.get("X-Profile") == "1"
+    )
+
+
+def _remove_old_profiles() -> None:
+    # File names start with the time of the request, so they sort by age
+    paths = sorted(glob.glob(os.path.join(config.PROFILES_DIR, "*.prof")))
+    for path in paths[: max(0, len(paths) - config.PROFILES_KEEP)]:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            # Removed by another worker
+            pass
+
+
+def _before_request() -> None:
+    g.request_started_at = time.perf_counter()
+    if _profiling_requested():
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+
+
+def _after_request(response: Response) -> Response:
+    if "request_started_at" not in g:
+        # Another before_request function returned a response first
+        return response
+    elapsed = time.perf_counter() - g.request_started_at
+    profiler: Optional[cProfile.Profile] = g.pop("profiler", None)
+    if profiler is not None:
+        profiler.disable()
+        os.makedirs(config.PROFILES_DIR, exist_ok=True)
+        file_name = f"{datetime.now():%Y%m%d-%H%M%S-%f}-{request.endpoint}.prof"
+        profiler.dump_stats(os.path.join(config.PROFILES_DIR, file_name))
+        _remove_old_profiles()
+        response.headers["X-Profile-File"] = file_name
+
+    spans = g.get("spans", {})
+    response.headers["Server-Timing"] = ", ".join(
+        [f"{name};dur={seconds * 1000:.2f}" for name, seconds in spans.items()]
+        + [f"total;dur={elapsed * 1000:.2f}"]
+    )
+
+    endpoint = request.endpoint or "none"
+    metrics.observe(
+        "http_request_duration_seconds",
+        elapsed,
+        endpoint=endpoint,
+        method=request.method,
+        status=response.status_code,
+    )
+    for name, seconds in spans.items():
+        metrics.observe("span_duration_seconds", seconds, span=name)
+    if "response_cache" in g:
+        metrics.inc(
+            "response_cache_requests_total", endpoint=endpoint, result=g.response_cache
+        )
+    metrics.flush()
+    return response
+
+
+def init_metrics(app: Flask) -> None:
+    """
+    Time every request and add Server-Timing header to responses.
+    With PROFILING=1 in the environment, requests with ?profile=1 or X-Profile: 1
+    header are profiled, the dump is saved to PROFILES_DIR and its name is
+    returned in X-Profile-File header. Only the latest PROFILES_KEEP dumps are kept.
+    """
+    app.before_request(_before_request)
+    app.after_request(_after_request)
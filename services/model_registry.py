@@ -0,0 +1,124 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable
+
+import config
+from services.forecaster import load_model_artifact
+
+
+class ModelRegistry:
+    """
+    In-process LRU cache of loaded models.
+
+    Entries are invalidated when the model file mtime changes or the file is removed,
+    so retrained or erased models are picked up. Memory usage of an entry is
+    estimated by the size of its file on disk.
+    """
+
+    def __init__(self, loader: Callable[[str], Any], max_size: int, max_bytes: int):
+        """
+        :param loader: Function that loads a model from the file path.
+        :param max_size: Max number of models kept in memory.
+        :param max_bytes: Max total size of models kept in memory.
+        """
+        self.loader = loader
+        self.max_size = max_size
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, tuple[int, int, Any]]" = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.invalidations = 0
+
+    def _pop(self, path: str) -> None:
+        _, size, _ = self._entries.pop(path)
+        self._total_bytes -= size
+
+    def get(self, path: str) -> Any:
+        """
+        Return model stored at path, loading it from disk only if it's not cached
+        or the file has changed.
+
+        :param path: Path to the model file.
+        """
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            with self._lock:
+                if path in self._entries:
+                    self._pop(path)
+                    self.invalidations += 1
+            raise
+
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None:
+                if entry[0] == stat.st_mtime_ns:
+                    self._entries.move_to_end(path)
+                    self.hits += 1
+                    return entry[2]
+                self._pop(path)
+                self.invalidations += 1
+            self.misses += 1
+
+        model = self.loader(path)
+
+        with self._lock:
+            if path in self._entries:
+                self._pop(path)
+            self._entries[path] = (stat.st_mtime_ns, stat.st_size, model)
+            self._total_bytes += stat.st_size
+            self._evict()
+        return model
+
+    def _evict(self) -> None:
+        while len(self._entries) > 1 and (
+            len(self._entries) > self.max_size or self._total_bytes > self.max_bytes
+        ):
+            self._pop(next(iter(self._entries)))
+            self.evictions += 1
+
+    def preload(self, models: dict[str, Any]) -> None:
+        """
+        Put already loaded models into the cache, e.g. the ones loaded by
+        the forecast engine, so they are not loaded from disk once more.
+
+        :param models: Models by path to the model file.
+        """
+        for path, model in models.items():
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            with self._lock:
+                if path in self._entries:
+                    self._pop(path)
+                self._entries[path] = (stat.st_mtime_ns, stat.st_size, model)
+                self._total_bytes += stat.st_size
+                self._evict()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._total_bytes = 0
+
+    def stats(self) -> dict[str, int]:
+        """
+        Return cache counters and current size.
+        """
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "bytes": self._total_bytes,
+                "max_size": self.max_size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+model_registry = ModelRegistry(
+    load_model_artifact, config.MODEL_CACHE_SIZE, config.MODEL_CACHE_MAX_BYTES
+)
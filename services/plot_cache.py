@@ -0,0 +1,160 @@
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Optional
+
+import pandas as pd
+
+import config
+from services.data_store import get_product_data
+from services.forecast import PLOT_FORMATS, PLOT_PRESETS, create_forecast_plot
+from services.forecast_table import get_forecast_row
+from services.metrics import count_request
+from services.tools import atomic_write, ensure_directory_exists_and_writable
+
+# Change when the plot look changes, so previously rendered plots are not served
+PLOT_STYLE_VERSION = 1
+
+
+def _plot_keys(product_slug: str, variants: list[tuple[str, str]]) -> list[str]:
+    _, dates, prices = get_product_data().get_product(product_slug)
+    forecast_row = json.dumps(get_forecast_row(product_slug), sort_keys=True)
+
+    keys = []
+    for preset, fmt in variants:
+        digest = hashlib.sha256()
+        digest.update(f"{PLOT_STYLE_VERSION}:{preset}:{fmt}".encode())
+        digest.update(dates.tobytes())
+        digest.update(prices.tobytes())
+        digest.update(forecast_row.encode())
+        keys.append(digest.hexdigest())
+    return keys
+
+
+def plot_key(product_slug: str, preset: str = "default", fmt: str = "png") -> str:
+    """
+    Content address of the plot: hash of everything drawn on it.
+    Retraining changes the forecast or data and therefore the key,
+    so outdated plots are never served.
+
+    :param product_slug: Slugified product name.
+    :param preset: Size preset, see PLOT_PRESETS.
+    :param fmt: Image format, see PLOT_FORMATS.
+    """
+    return _plot_keys(product_slug, [(preset, fmt)])[0]
+
+
+def _plot_path(key: str, fmt: str = "png") -> str:
+    return os.path.join(config.PLOTS_DIR, f"{key}.{fmt}")
+
+
+def render_plot(
+    product_slug: str, path: str, preset: str = "default", fmt: str = "png"
+) -> None:
+    """
+    Render forecast plot of the product to a file.
+    The file is renamed into place, so other workers never read a partial image.
+    """
+    product_name, dates, prices = get_product_data().get_product(product_slug)
+    forecast_row = get_forecast_row(product_slug)
+    data = pd.DataFrame({"Product": product_name, "Date": dates, "Price": prices})
+
+    buf = create_forecast_plot(
+        data,
+        pd.to_datetime(forecast_row["dates"]),
+        forecast_row["constrained_forecast"],
+        forecast_row["product_name"],
+        forecast_row["train_mae"],
+        forecast_row["test_mae"],
+        forecast_row["rmse"],
+        preset=preset,
+        fmt=fmt,
+    )
+    atomic_write(path, buf.getvalue())
+
+
+def get_plot_file(
+    product_slug: str, preset: str = "default", fmt: str = "png"
+) -> tuple[str, str]:
+    """
+    Return path to the rendered plot of the product, rendering it on cache miss.
+    Plots are stored on disk and shared by all workers.
+
+    :param product_slug: Slugified product name.
+    :param preset: Size preset, see PLOT_PRESETS.
+    :param fmt: Image format, see PLOT_FORMATS.
+    :return: Path to the image file and its content key to be used as ETag.
+    """
+    if preset not in PLOT_PRESETS or fmt not in PLOT_FORMATS:
+        raise ValueError(f"Unsupported plot preset '{preset}' or format '{fmt}'")
+    key = plot_key(product_slug, preset, fmt)
+    path = _plot_path(key, fmt)
+    hit = os.path.isfile(path)
+    count_request("plot_cache_requests_total", result="hit" if hit else "miss")
+    if not hit:
+        ensure_directory_exists_and_writable(config.PLOTS_DIR)
+        render_plot(product_slug, path, preset, fmt)
+    return path, key
+
+
+def _render_if_missing(product_slug: str) -> Optional[str]:
+    try:
+        _, key = get_plot_file(product_slug)
+    except Exception as e:
+        # E.g. model of the product failed to train, other plots are still rendered
+        print(f"Plot for {product_slug} failed: {e}")  # logger.error
+        return None
+    return key
+
+
+def render_all_plots(
+    max_workers: Optional[int] = None, progress: Optional[Callable] = None
+) -> dict[str, int]:
+    """
+    Render default plots of all products in parallel and remove plots that
+    are not used anymore: plots of removed products and plots whose content
+    changed. Other presets and formats are rendered on demand and kept as long
+    as their content is the same.
+
+    :param max_workers: Number of worker processes, by default TRAINING_WORKERS from config.py.
+    :param progress: Optional callback progress(stage, done, total), see services.jobs.
+    :return: Number of rendered and removed plots.
+    """
+    max_workers = max_workers or config.TRAINING_WORKERS
+    ensure_directory_exists_and_writable(config.PLOTS_DIR)
+    existing = set(os.listdir(config.PLOTS_DIR))
+    product_slugs = [slug for _, slug in get_product_data().product_pairs]
+
+    keys = set()
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        results = executor.map(_render_if_missing, product_slugs, chunksize=8)
+        for done, key in enumerate(results, start=1):
+            if key is not None:
+                keys.add(key)
+            if progress:
+                progress("rendering plots", done, len(product_slugs))
+
+    rendered = {os.path.basename(_plot_path(key)) for key in keys}
+    variants = [(preset, fmt) for preset in PLOT_PRESETS for fmt in PLOT_FORMATS]
+    used = set(rendered)
+    for product_slug in product_slugs:
+        try:
+            product_keys = _plot_keys(product_slug, variants)
+        except Exception:
+            # Plot of the product failed above, its previous plots are outdated
+            continue
+        used.update(
+            os.path.basename(_plot_path(key, fmt))
+            for key, (_, fmt) in zip(product_keys, variants)
+        )
+    removed = 0
+    for filename in existing - used:
+        if filename.endswith(tuple(f".{fmt}" for fmt in PLOT_FORMATS)):
+            os.unlink(os.path.join(config.PLOTS_DIR, filename))
+            removed += 1
+
+    print(
+        f"Rendered {len(rendered - existing)} plots, removed {removed} outdated plots"
+    )  # logger.info
+    return {"rendered": len(rendered - existing), "removed": removed}
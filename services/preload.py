@@ -0,0 +1,35 @@
+import gc
+import os
+
+import config
+from services.batch_forecast import get_forecast_engine
+from services.data_store import get_product_data
+from services.forecast_table import load_forecast_table
+from services.forecaster import model_file_path
+from services.model_registry import model_registry
+
+
+def preload_serving_state() -> None:
+    """
+    Load the data, all models and the forecast table before gunicorn forks workers,
+    see gunicorn.conf.py. Workers share these pages copy-on-write with the master
+    and serve their first request warm.
+
+    Loaded objects are moved to the permanent generation of the garbage collector,
+    so collections in workers do not write to, and thereby copy, the shared pages.
+    """
+    if os.path.isfile(config.DATA_COLUMNS_PATH):
+        get_product_data()
+    if os.path.isdir(config.MODELS_DIR):
+        engine = get_forecast_engine()
+        model_registry.preload(
+            {
+                model_file_path(config.MODELS_DIR, slug): model_dict
+                for slug, model_dict in engine.models.items()
+            }
+        )
+    load_forecast_table()
+
+    gc.collect()
+    gc.freeze()
+    print(f"Serving state preloaded in process {os.getpid()}")  # logger.info
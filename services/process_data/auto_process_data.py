@@ -1,66 +1,202 @@
 import os
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Callable, Optional
 
 import pandas as pd
-from flask import Response, jsonify
+from flask import Response, jsonify, url_for
 
 import config
+from services.cache_generation import bump_generation
+from services.data_store import open_price_data, save_price_data
+from services.forecast_table import build_forecast_table
+from services.jobs import submit_job
+from services.plot_cache import render_all_plots
 from services.process_data.clean_data import clean_data, wide_to_long
-from services.process_data.download_data import download_data_sheet, xlsx_to_csv
-from services.process_data.generate_models import make_forecast, split_data
-from services.tools import ensure_directory_exists_and_writable
+from services.process_data.download_data import (
+    download_data_sheet,
+    mark_download_processed,
+    xlsx_to_dataframe,
+)
+from services.process_data.generate_models import split_data
+from services.process_data.merge_data import merge_price_data
+from services.process_data.train_models import train_models
+from services.tools import (
+    atomic_write,
+    check_models_availability,
+    ensure_directory_exists_and_writable,
+)
+
+
+@contextmanager
+def _timed_stage(stage: str, timings: dict[str, float], progress: Callable):
+    progress(stage)
+    start = time.perf_counter()
+    yield
+    timings[stage] = time.perf_counter() - start
+    print(f"Stage '{stage}' took {timings[stage]:.2f}s")  # logger.info
+
+
+def save_data(df_long: pd.DataFrame) -> None:
+    """
+    Save cleaned long data: columnar file used by the service and CSV export.
+    Both files are renamed into place, see atomic_write.
+
+    :param df_long: Long dataframe with "Product", "Date" and "Price" columns.
+    """
+    save_price_data(df_long, config.DATA_COLUMNS_PATH)
+
+    atomic_write(config.DATA_FILE_PATH, df_long.to_csv)
+
+    print(f"Data cleaned and saved to {config.DATA_COLUMNS_PATH}")  # logger.info
+
 
+def _up_to_date_summary(
+    timings: dict[str, float], changes: Optional[dict[str, Any]] = None
+) -> dict[str, Any]:
+    return {
+        "total": 0,
+        "succeeded": [],
+        "failed": {},
+        "timings": {},
+        "stages": timings,
+        "changes": changes,
+    }
 
-def auto_process_data(data_download_url: str = None) -> None:
+
+def auto_process_data(
+    data_download_url: str = None,
+    progress: Optional[Callable] = None,
+    incremental: bool = False,
+    data_file_path: Optional[str] = None,
+) -> dict[str, Any]:
     """
     Combined script to download/read data, clean it and generate models.
+    Data is passed between stages in memory and saved once models are trained.
 
     :param data_download_url: Rosstat data sheet url. Default is at config.py.
-        If this parameter is None, the script will try to load data from the data dir.
+        If this parameter is None, the script will try to load data from data_file_path.
+    :param progress: Optional callback progress(stage, done, total), see services.jobs.
+    :param incremental: Merge new data into the stored dataset instead of replacing it,
+        see merge_price_data. Nothing is retrained if the data sheet is not modified
+        since the last processed download or the data did not change.
+    :param data_file_path: Wide CSV data sheet used when data_download_url is None,
+        DATA_FILE_PATH by default.
+    :return: Training summary, see train_models, with time spent in every stage
+        in "stages" and, in incremental mode, changes of the data in "changes".
     """
+    progress = progress or (lambda *args, **kwargs: None)
+    timings: dict[str, float] = {}
 
     # Get data either from web or from disk
     if data_download_url is not None:
-        file_path_xlsx = download_data_sheet(data_download_url, config.DATA_DIR)
-        file_path_csv = xlsx_to_csv(file_path_xlsx)
-
-        print(f"Data downloaded to {file_path_csv}")  # logger.info
+        with _timed_stage("downloading", timings, progress):
+            file_path_xlsx, modified = download_data_sheet(
+                data_download_url, config.DATA_DIR, conditional=incremental
+            )
+        if not modified and check_models_availability():
+            print("Data sheet is not modified, models are not retrained")  # logger.info
+            return _up_to_date_summary(timings)
+        with _timed_stage("reading", timings, progress):
+            data = xlsx_to_dataframe(
+                file_path_xlsx, max_workers=config.TRAINING_WORKERS
+            )
+
+        print(f"Data downloaded to {file_path_xlsx}")  # logger.info
     else:
-        file_path_csv = config.DATA_FILE_PATH
+        data = data_file_path or config.DATA_FILE_PATH
 
     # Clean and process the data
-    df = clean_data(file_path_csv)
-    df_long = wide_to_long(df)
+    with _timed_stage("cleaning", timings, progress):
+        df = clean_data(data)
+        df_long = wide_to_long(df)
+
+    changes = None
+    if incremental and os.path.isfile(config.DATA_COLUMNS_PATH):
+        with _timed_stage("merging", timings, progress):
+            df_long, changes = merge_price_data(
+                open_price_data(config.DATA_COLUMNS_PATH), df_long
+            )
+        print(
+            f"New data: {changes['added_rows']} added and {changes['updated_rows']} "
+            f"updated rows of {len(changes['changed_products'])} products"
+        )  # logger.info
+
+        if not changes["changed_products"] and check_models_availability():
+            print("Data is up to date, models are not retrained")  # logger.info
+            if data_download_url is not None:
+                mark_download_processed(config.DATA_DIR)
+            return _up_to_date_summary(timings, changes)
+
+    dev_data, test_data = split_data(df_long, 0.15)
+
+    # Prepare directory
+    ensure_directory_exists_and_writable(config.MODELS_DIR)
 
-    # file_path = os.path.join(config.DATA_DIR, f"train_data_{datetime.now().strftime('%Y_%m_%d_%H_%M_%S')}.csv")
-    file_path = os.path.join(config.DATA_FILE_PATH)
-    df_long.to_csv(file_path)
+    # Forecasts of previous models are served until the table is rebuilt below
+    with _timed_stage("training", timings, progress):
+        summary = train_models(
+            dev_data, test_data, progress=progress, incremental=incremental
+        )
+
+    with _timed_stage("saving data", timings, progress):
+        save_data(df_long)
 
-    print(f"Data cleaned and saved to {file_path}")  # logger.info
+    with _timed_stage("materializing forecasts", timings, progress):
+        build_forecast_table()
 
-    df = pd.read_csv(
-        file_path, index_col=0, dtype={"Price": float}, parse_dates=["Date"]
+    # Responses cached by any worker for the previous models are not served anymore
+    bump_generation()
+    if data_download_url is not None:
+        # The sheet is not downloaded again until it changes
+        mark_download_processed(config.DATA_DIR)
+
+    with _timed_stage("rendering plots", timings, progress):
+        render_all_plots(progress=progress)
+
+    summary["stages"] = timings
+    if changes is not None:
+        summary["changes"] = changes
+    return summary
+
+
+def job_response(job_id: str) -> tuple[Response, int]:
+    return (
+        jsonify(
+            {
+                "success": True,
+                "job_id": job_id,
+                "status_url": url_for("models.get_job_status", job_id=job_id),
+            }
+        ),
+        202,
     )
-    dev_data, test_data = split_data(df, 0.15)
-    products = dev_data["Product"].unique()
 
-    # Prepare directory
-    ensure_directory_exists_and_writable(config.MODELS_DIR)
 
-    for product in products:
-        print(f"Creating model for product {product}")  # logger.info
-        make_forecast(
-            product,
-            dev_data,
-            test_data,
-            use_train_test_split=True,
-            save_model=True,
-            show_plot=False,
-        )
+def process_uploaded_data(
+    file_path: str, progress: Optional[Callable] = None
+) -> dict[str, Any]:
+    """
+    Create models from an uploaded data sheet, see auto_process_data.
+    The sheet is removed once the job finishes.
+
+    :param file_path: Path to the uploaded CSV file.
+    :param progress: Optional callback, see services.jobs.
+    """
+    try:
+        return auto_process_data(progress=progress, data_file_path=file_path)
+    finally:
+        if os.path.isfile(file_path):
+            os.unlink(file_path)
 
 
 def handle_model_upload(files) -> tuple[Response, int]:
     """
     Handle the uploading of a CSV file for model creation on the /models endpoint.
+    Models are created in a background job, response contains its id.
+    Every upload is saved to its own file, so it is not overwritten by other
+    jobs before its job starts.
 
     :param files: Property files of flask.wrappers.Request. Sent in POST request.
     """
@@ -73,11 +209,14 @@ def handle_model_upload(files) -> tuple[Response, int]:
         return jsonify({"success": False, "error": "No file provided"}), 400
 
     if file and file.filename.endswith(".csv"):
-        file.save(config.DATA_FILE_PATH)
+        ensure_directory_exists_and_writable(config.UPLOADS_DIR)
+        file_path = os.path.join(config.UPLOADS_DIR, f"{uuid.uuid4().hex}.csv")
+        file.save(file_path)
         try:
-            auto_process_data()
-            return jsonify({"success": True}), 200
+            job_id = submit_job("training", process_uploaded_data, file_path=file_path)
+            return job_response(job_id)
         except Exception as e:
+            os.unlink(file_path)
             return jsonify({"success": False, "error": str(e)}), 400
     else:
         return (
@@ -91,14 +230,24 @@ def handle_model_upload(files) -> tuple[Response, int]:
         )
 
 
-def handle_model_creation_with_url(download_url: str) -> tuple[Response, int]:
+def handle_model_creation_with_url(
+    download_url: str, incremental: bool = True
+) -> tuple[Response, int]:
     """
-    Handle the creation of models using a custom URL on the /models endpoint
+    Handle the creation of models using a custom URL on the /models endpoint.
+    Models are created in a background job, response contains its id.
 
     :param download_url: Rosstat data sheet url. Default is at config.py.
+    :param incremental: Merge downloaded data into the stored dataset,
+        see auto_process_data.
     """
     try:
-        auto_process_data(data_download_url=download_url)
-        return jsonify({"success": True}), 200
+        job_id = submit_job(
+            "training",
+            auto_process_data,
+            data_download_url=download_url,
+            incremental=incremental,
+        )
+        return job_response(job_id)
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 400
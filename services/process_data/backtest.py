@@ -0,0 +1,304 @@
+import json
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from typing import Any, Callable, Optional
+
+import numpy as np
+import pandas as pd
+
+import config
+from services.data_store import get_product_data
+from services.forecaster import (
+    HoltWintersForecaster,
+    load_model_artifact,
+    model_file_path,
+)
+from services.process_data.model_selection import (
+    DEFAULT_MODEL_SPEC,
+    is_feasible,
+    spec_name,
+    spec_of_model,
+)
+from services.tools import atomic_write, slugify
+
+# Kinds of models backtested: the one saved for every product or DEFAULT_MODEL_SPEC
+BACKTEST_SPECS = ("saved", "default")
+
+
+def rolling_origins(
+    length: int, horizon: int, origins: int, step: int
+) -> list[tuple[int, int]]:
+    """
+    Forecast origins of a series, the last one leaves exactly horizon points to
+    forecast. Origins without any point to train on are dropped.
+
+    :param length: Number of points in the series.
+    :param horizon: Number of points forecast from every origin.
+    :param origins: Number of origins.
+    :param step: Number of points between adjacent origins.
+    :return: Pairs of cutoff, the number of training points, and number of points
+        to forecast, from the earliest origin.
+    """
+    cutoffs = [length - horizon - i * step for i in reversed(range(origins))]
+    return [(cutoff, min(horizon, length - cutoff)) for cutoff in cutoffs if cutoff > 0]
+
+
+def _fit(prices: np.ndarray, model_spec: dict[str, Any], start_params):
+    from statsmodels.tsa.holtwinters import ExponentialSmoothing
+
+    return ExponentialSmoothing(pd.Series(prices), **model_spec).fit(
+        start_params=start_params
+    )
+
+
+def backtest_product(
+    product_name: str,
+    dates: np.ndarray,
+    prices: np.ndarray,
+    model_spec: dict[str, Any],
+    horizon: int,
+    origins: int,
+    step: int,
+    warm_start: bool = True,
+) -> tuple[str, Optional[dict[str, Any]], Optional[str], float]:
+    """
+    Rolling-origin evaluation of a single product: the model is fitted on data
+    up to every origin and forecasts the points after it. Runs inside a pool
+    worker, so any error is caught and returned instead of raised.
+
+    :param product_name: Name of the product.
+    :param dates: Dates of the product, sorted.
+    :param prices: Prices of the product in the same order.
+    :param model_spec: Trend and seasonality of the model, see make_forecast.
+    :param horizon: Number of points forecast from every origin.
+    :param origins: Number of origins.
+    :param step: Number of points between adjacent origins.
+    :param warm_start: Start every fit from parameters of the fit at the previous
+        origin, which has almost the same data. Failed warm fits are refitted cold.
+    :return: Product name, metrics (None on failure), error message and time spent.
+    """
+    warnings.filterwarnings("ignore", message="Optimization failed to converge.")
+    start = time.perf_counter()
+
+    errors, actuals, results = [], [], []
+    fit_seconds, fit_iterations = 0.0, 0
+    start_params = None
+    try:
+        for cutoff, steps in rolling_origins(len(prices), horizon, origins, step):
+            if not is_feasible(model_spec, prices[:cutoff]):
+                continue
+            fit_start = time.perf_counter()
+            try:
+                model_fit = _fit(prices[:cutoff], model_spec, start_params)
+            except Exception:
+                if start_params is None:
+                    raise
+                model_fit = _fit(prices[:cutoff], model_spec, None)
+            fit_seconds += time.perf_counter() - fit_start
+            fit_iterations += int(getattr(model_fit.mle_retvals, "nit", 0))
+
+            # Forecast as it is served, see services.batch_forecast
+            model = HoltWintersForecaster.from_results(model_fit)
+            if warm_start:
+                start_params = model.start_params()
+            actual = prices[cutoff : cutoff + steps]
+            error = model.forecast(steps) - actual
+            errors.append(error)
+            actuals.append(actual)
+            results.append(
+                {
+                    "cutoff": str(dates[cutoff - 1].astype("datetime64[D]")),
+                    "mae": float(np.mean(np.abs(error))),
+                }
+            )
+        if not results:
+            raise ValueError("Series is too short for any origin")
+    except Exception as e:
+        elapsed = time.perf_counter() - start
+        return product_name, None, f"{type(e).__name__}: {e}", elapsed
+
+    error, actual = np.concatenate(errors), np.concatenate(actuals)
+    # Percentage errors of zero prices are undefined, such points are skipped
+    nonzero = actual != 0
+    mape = None
+    if nonzero.any():
+        mape = float(np.mean(np.abs(error[nonzero] / actual[nonzero])) * 100)
+    metrics = {
+        "model_spec": spec_name(model_spec),
+        "points": len(error),
+        "mae": float(np.mean(np.abs(error))),
+        "rmse": float(np.sqrt(np.mean(error**2))),
+        "mape": mape,
+        "mape_points": int(nonzero.sum()),
+        "fits": len(results),
+        "fit_seconds": fit_seconds,
+        "fit_iterations": fit_iterations,
+        "origins": results,
+    }
+    return product_name, metrics, None, time.perf_counter() - start
+
+
+def _saved_model_spec(product_name: str) -> dict[str, Any]:
+    path = model_file_path(config.MODELS_DIR, slugify(product_name))
+    try:
+        return spec_of_model(load_model_artifact(path)["model"])
+    except Exception:
+        return DEFAULT_MODEL_SPEC
+
+
+def _aggregate(products: dict[str, dict[str, Any]]) -> dict[str, Any]:
+    """
+    Metrics over forecast points of all products, products with longer history
+    weigh more. MAPE is pooled over points with nonzero prices, None if there are
+    none.
+    """
+    metrics = list(products.values())
+    points = np.array([m["points"] for m in metrics], dtype=np.float64)
+    if not points.sum():
+        return {}
+
+    def pooled(values):
+        return float(np.dot(values, points) / points.sum())
+
+    mape_points = np.array([m["mape_points"] for m in metrics], dtype=np.float64)
+    mape = None
+    if mape_points.sum():
+        mapes = [m["mape"] or 0.0 for m in metrics]
+        mape = float(np.dot(mapes, mape_points) / mape_points.sum())
+
+    fits = sum(m["fits"] for m in metrics)
+    fit_seconds = sum(m["fit_seconds"] for m in metrics)
+    return {
+        "points": int(points.sum()),
+        "mae": pooled([m["mae"] for m in metrics]),
+        "rmse": float(np.sqrt(pooled([m["rmse"] ** 2 for m in metrics]))),
+        "mape": mape,
+        "median_product_mae": float(np.median([m["mae"] for m in metrics])),
+        "fits": fits,
+        "fit_seconds": fit_seconds,
+        "fit_seconds_per_fit": fit_seconds / fits,
+        "fit_iterations_per_fit": sum(m["fit_iterations"] for m in metrics) / fits,
+    }
+
+
+def save_report(report: dict[str, Any], path: str) -> None:
+    """
+    Save report, it is renamed into place, see atomic_write.
+    """
+    atomic_write(path, json.dumps(report, ensure_ascii=False))
+
+
+def read_report(path: Optional[str] = None) -> Optional[dict[str, Any]]:
+    """
+    Read the last backtest report, None if there is none.
+    """
+    try:
+        with open(path or config.BACKTEST_REPORT_PATH) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def run_backtest(
+    spec: str = "saved",
+    horizon: Optional[int] = None,
+    origins: Optional[int] = None,
+    step: Optional[int] = None,
+    warm_start: bool = True,
+    max_workers: Optional[int] = None,
+    progress: Optional[Callable] = None,
+    report_path: Optional[str] = None,
+) -> dict[str, Any]:
+    """
+    Backtest models of all products on the stored data in parallel and save
+    a report with metrics of every product and aggregate ones.
+
+    :param spec: Kind of models, one of BACKTEST_SPECS: "saved" uses the kind of
+        the saved model of every product, "default" uses DEFAULT_MODEL_SPEC.
+    :param horizon: Number of weeks forecast from every origin, BACKTEST_HORIZON by default.
+    :param origins: Number of origins per product, BACKTEST_ORIGINS by default.
+    :param step: Weeks between adjacent origins, BACKTEST_STEP by default.
+    :param warm_start: Reuse parameters of the fit at the previous origin, see backtest_product.
+    :param max_workers: Number of worker processes, by default TRAINING_WORKERS from config.py.
+    :param progress: Optional callback progress(stage, done, total), see services.jobs.
+    :param report_path: Path of the report, BACKTEST_REPORT_PATH by default.
+    :return: Report without metrics of every product.
+    """
+    if spec not in BACKTEST_SPECS:
+        raise ValueError(f"Unknown spec '{spec}', expected one of {BACKTEST_SPECS}")
+    horizon = horizon or config.BACKTEST_HORIZON
+    origins = origins or config.BACKTEST_ORIGINS
+    step = step or config.BACKTEST_STEP
+    max_workers = max_workers or config.TRAINING_WORKERS
+
+    data = get_product_data()
+    tasks = []
+    for i, product in enumerate(data.products):
+        rows = slice(data.offsets[i], data.offsets[i + 1])
+        model_spec = (
+            _saved_model_spec(product) if spec == "saved" else DEFAULT_MODEL_SPEC
+        )
+        tasks.append(
+            (
+                product,
+                np.asarray(data.dates[rows]),
+                np.asarray(data.prices[rows]),
+                model_spec,
+                horizon,
+                origins,
+                step,
+                warm_start,
+            )
+        )
+
+    products, failed = {}, {}
+    start = time.perf_counter()
+    if progress:
+        progress("backtesting", 0, len(tasks))
+
+    def collect(product_name, metrics, error, elapsed):
+        if error is None:
+            products[product_name] = metrics
+        else:
+            failed[product_name] = error
+            print(f"Backtest of {product_name} failed: {error}")  # logger.error
+        if progress:
+            progress("backtesting", len(products) + len(failed), len(tasks))
+
+    if max_workers == 1:
+        for task in tasks:
+            collect(*backtest_product(*task))
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                executor.submit(backtest_product, *task): task[0] for task in tasks
+            }
+            for future in as_completed(futures):
+                try:
+                    result = future.result()
+                except Exception as e:
+                    # Worker process died, e.g. killed by OOM
+                    result = (futures[future], None, f"{type(e).__name__}: {e}", 0.0)
+                collect(*result)
+
+    report = {
+        "date_created": datetime.now().isoformat(timespec="seconds"),
+        "spec": spec,
+        "horizon": horizon,
+        "origins": origins,
+        "step": step,
+        "warm_start": warm_start,
+        "workers": max_workers,
+        "elapsed": time.perf_counter() - start,
+        "aggregate": _aggregate(products),
+        "failed": failed,
+        "products": products,
+    }
+    save_report(report, report_path or config.BACKTEST_REPORT_PATH)
+    print(
+        f"Backtested {len(products)}/{len(tasks)} products in {report['elapsed']:.2f}s, "
+        f"MAE: {report['aggregate'].get('mae')}"
+    )  # logger.info
+    return {k: v for k, v in report.items() if k != "products"}
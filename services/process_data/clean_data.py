@@ -1,19 +1,30 @@
 import os
+from typing import Union
 
+import numpy as np
 import pandas as pd
 
 import config
 
+# Placeholders Rosstat uses for missing values
+NA_VALUES = ["...", "…"]
 
-def clean_data(file_name: str) -> pd.DataFrame:
+
+def clean_data(data: Union[str, pd.DataFrame]) -> pd.DataFrame:
     """
     Read csv, convert to DF and clean NaN's
+
+    :param data: Path to wide csv file or wide dataframe, see xlsx_to_dataframe.
     """
-    if not os.path.isfile(file_name):
-        raise RuntimeError(f"The file '{file_name}' does not exist.")
+    if isinstance(data, pd.DataFrame):
+        # Coerce invalid values to NaN
+        df = data.replace(NA_VALUES, np.nan)
+    else:
+        if not os.path.isfile(data):
+            raise RuntimeError(f"The file '{data}' does not exist.")
 
-    # Read csv and coerce invalid values to NaN
-    df = pd.read_csv(file_name, na_values=["...", "…"])
+        # Read csv and coerce invalid values to NaN
+        df = pd.read_csv(data, na_values=NA_VALUES)
 
     # Clear NaN rows
     df.dropna(inplace=True)
@@ -34,8 +45,14 @@ def wide_to_long(df: pd.DataFrame) -> pd.DataFrame:
         df, id_vars=["Наименование"], var_name="Date", value_name="Price"
     )
     price_data_long.columns = ["Product", "Date", "Price"]
-    # Convert Date column to datetime format
-    price_data_long["Date"] = pd.to_datetime(price_data_long["Date"], format="%Y-%m-%d")
+
+    # Convert Date column to datetime format. Headers are strings when read from csv
+    # and dates otherwise, they are converted once per column instead of once per row.
+    # Melt stacks the columns one after another.
+    date_columns = pd.to_datetime(
+        [str(column) for column in price_data.columns], format="%Y-%m-%d"
+    )
+    price_data_long["Date"] = np.repeat(date_columns.values, len(df))
 
     # Convert Price column to numeric, forcing errors to NaN
     price_data_long["Price"] = pd.to_numeric(price_data_long["Price"], errors="coerce")
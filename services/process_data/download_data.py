@@ -1,76 +1,269 @@
+import json
 import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Optional
 
 import pandas as pd
 import requests
 
 import config
-from services.tools import ensure_directory_exists_and_writable, parse_dates
+from services.tools import (
+    atomic_write,
+    ensure_directory_exists_and_writable,
+    parse_dates,
+)
 
+# Errors after which the download is resumed
+RETRYABLE_ERRORS = (
+    requests.ConnectionError,
+    requests.Timeout,
+    requests.exceptions.ChunkedEncodingError,
+)
 
-def download_data_sheet(url: str, path: str = config.DATA_DIR) -> str:
-    """
-    Download stats sheet from Rosstat website
+_session: Optional[requests.Session] = None
 
-    :param url: Rosstat file download URL
-    :param path: Path to download directory, by default set to DATA_DIR from config.py
-    :return: Path to downloaded file
+
+def get_session() -> requests.Session:
     """
-    ensure_directory_exists_and_writable(path)
+    Return process-wide HTTP session, so connections to Rosstat are reused.
+    """
+    global _session
+    if _session is None:
+        _session = requests.Session()
+    return _session
 
-    response = requests.get(url, stream=True)
 
-    if response.status_code != 200:
-        raise RuntimeError(
-            f"Failed to download file. Status code: {response.status_code}"
-        )
+def _state_path(file_path: str) -> str:
+    return f"{file_path}.json"
+
+
+def _read_state(file_path: str) -> dict[str, Any]:
+    try:
+        with open(_state_path(file_path)) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def _write_state(file_path: str, state: dict[str, Any]) -> None:
+    atomic_write(_state_path(file_path), json.dumps(state))
+
+
+def _expected_size(response: requests.Response, offset: int) -> Optional[int]:
+    if response.status_code == 206:
+        total = response.headers.get("Content-Range", "").rpartition("/")[2]
+        return int(total) if total.isdigit() else None
+    length = response.headers.get("Content-Length")
+    if length is None or response.headers.get("Content-Encoding"):
+        return None
+    return offset + int(length)
+
 
-    file_path = os.path.join(config.DATA_DIR, "data.xlsx")
+def _download(url: str, file_path: str, conditional: bool) -> tuple[str, bool]:
+    state = _read_state(file_path)
+    part_path = f"{file_path}.part"
+    partial = state.get("partial") or {}
+    validator = partial.get("etag") or partial.get("last_modified")
 
-    # Open the file in binary write mode
-    with open(file_path, "wb") as file:
-        for chunk in response.iter_content(chunk_size=8192):
-            if chunk:
+    headers = {}
+    offset = 0
+    if os.path.isfile(part_path) and partial.get("url") == url and validator:
+        # Resume, the server sends the whole file if it has changed since
+        offset = os.path.getsize(part_path)
+        headers["Range"] = f"bytes={offset}-"
+        headers["If-Range"] = validator
+    elif conditional and os.path.isfile(file_path) and state.get("url") == url:
+        if state.get("etag"):
+            headers["If-None-Match"] = state["etag"]
+        if state.get("last_modified"):
+            headers["If-Modified-Since"] = state["last_modified"]
+
+    with get_session().get(
+        url, headers=headers, stream=True, timeout=config.DOWNLOAD_TIMEOUT
+    ) as response:
+        if response.status_code == 304:
+            print(f"File at {url} is not modified since last download")  # logger.info
+            return file_path, False
+        if response.status_code == 416:
+            # Partial file does not match the remote one, start over
+            os.unlink(part_path)
+            state.pop("partial", None)
+            _write_state(file_path, state)
+            return _download(url, file_path, conditional)
+        if response.status_code not in (200, 206):
+            raise RuntimeError(
+                f"Failed to download file. Status code: {response.status_code}"
+            )
+        if response.status_code == 200:
+            offset = 0
+
+        state["partial"] = {
+            "url": url,
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+        }
+        _write_state(file_path, state)
+
+        with open(part_path, "ab" if offset else "wb") as file:
+            for chunk in response.iter_content(chunk_size=64 * 1024):
                 file.write(chunk)
+        expected_size = _expected_size(response, offset)
+
+    size = os.path.getsize(part_path)
+    if expected_size is not None and size < expected_size:
+        raise requests.ConnectionError(
+            f"Download interrupted at {size} of {expected_size} bytes"
+        )
 
     # Set file permissions
-    os.chmod(file_path, 0o600)
+    os.chmod(part_path, 0o600)
+    os.replace(part_path, file_path)
+    # Validators of the new file are sent only after it is processed,
+    # see mark_download_processed
+    state["pending"] = state.pop("partial")
+    _write_state(file_path, state)
+    return file_path, True
 
-    print(f"File downloaded successfully and saved to {file_path}")
 
-    return file_path
+def mark_download_processed(path: str = config.DATA_DIR) -> None:
+    """
+    Keep validators of the last downloaded sheet for conditional downloads once
+    its data is saved and models are trained. Until then the server is asked
+    with validators of the previous sheet, so a sheet whose processing failed
+    is downloaded and processed again.
 
+    :param path: Path to download directory, by default set to DATA_DIR from config.py
+    """
+    file_path = os.path.join(path, "data.xlsx")
+    state = _read_state(file_path)
+    pending = state.pop("pending", None)
+    if pending is not None:
+        state.update(pending)
+        _write_state(file_path, state)
 
-def xlsx_to_csv(xlsx_file_path: str) -> str:
+
+def download_data_sheet(
+    url: str, path: str = config.DATA_DIR, conditional: bool = False
+) -> tuple[str, bool]:
     """
-    Turn multiple xlsx sheets into one csv file
-    :param xlsx_file_path: Path to xlsx file
-    :return: Path to converted file
+    Download stats sheet from Rosstat website.
+    The file is downloaded to a partial file, which is renamed into place once complete.
+    Interrupted downloads are resumed with range requests.
+
+    :param url: Rosstat file download URL
+    :param path: Path to download directory, by default set to DATA_DIR from config.py
+    :param conditional: Ask the server to send the file only if it has changed
+        since the last processed download, according to its ETag and Last-Modified.
+    :return: Path to downloaded file and whether it has changed
+    """
+    ensure_directory_exists_and_writable(path)
+    file_path = os.path.join(path, "data.xlsx")
+
+    # The file is downloaded at least once, whatever DOWNLOAD_RETRIES is
+    attempts = max(1, config.DOWNLOAD_RETRIES)
+    for attempt in range(1, attempts + 1):
+        try:
+            file_path, modified = _download(url, file_path, conditional)
+            break
+        except RETRYABLE_ERRORS as e:
+            if attempt == attempts:
+                raise RuntimeError(f"Failed to download file: {e}") from e
+            print(f"Download of {url} failed, resuming: {e}")  # logger.error
+
+    if modified:
+        print(f"File downloaded successfully and saved to {file_path}")
+    return file_path, modified
+
+
+# Rows above the header in every year sheet
+XLSX_HEADER_ROW = 4
+
+
+def read_year_sheet(sheet, year: int) -> pd.DataFrame:
     """
+    Read a year sheet of the Rosstat workbook
+    :param sheet: Worksheet opened in read-only mode
+    :param year: Year of the sheet
+    :return: Dataframe with "Наименование" column followed by a column per date
+    """
+    rows = sheet.iter_rows(min_row=XLSX_HEADER_ROW, values_only=True)
+    header = next(rows, None)
+    if header is None:
+        raise ValueError(f"Sheet '{sheet.title}' has no header")
+
+    # Cells to the right of the header are empty
+    width = len(header)
+    while width > 1 and header[width - 1] is None:
+        width -= 1
+
+    # Drop 'info' rows: where only first cell is filled
+    records = [
+        row[:width] for row in rows if any(value is not None for value in row[1:width])
+    ]
 
-    xls = pd.ExcelFile(xlsx_file_path)
-    sheet_names = xls.sheet_names
+    # Transform str dates in header into datetime format
+    columns = [header[0]] + [parse_dates(str(title), year) for title in header[1:width]]
+    return pd.DataFrame.from_records(records, columns=columns)
 
-    years = []
-    for sheet_name in sheet_names[1:]:
-        # Read the sheet into a DataFrame
-        df_current = pd.read_excel(xlsx_file_path, sheet_name=sheet_name, skiprows=3)
 
-        # Drop 'info' rows: where only first cell is filled
-        df_current = df_current[~df_current.iloc[:, 1:].isna().all(axis=1)]
+def _read_year_sheet_from_file(xlsx_file_path: str, sheet_name: str) -> pd.DataFrame:
+    import openpyxl
 
-        # Transform str dates in header into datetime format
-        new_headers = [df_current.columns[0]] + [
-            parse_dates(str(header), int(sheet_name))
-            for header in df_current.columns[1:]
-        ]
-        df_current.columns = new_headers
+    workbook = openpyxl.load_workbook(xlsx_file_path, read_only=True, data_only=True)
+    try:
+        return read_year_sheet(workbook[sheet_name], int(sheet_name))
+    finally:
+        workbook.close()
 
-        years.append(df_current)
+
+def xlsx_to_dataframe(xlsx_file_path: str, max_workers: int = 1) -> pd.DataFrame:
+    """
+    Combine multiple xlsx sheets into one wide dataframe.
+    The workbook is opened once and sheets are streamed row by row.
+    :param xlsx_file_path: Path to xlsx file
+    :param max_workers: Number of processes reading sheets in parallel,
+        every process opens the workbook on its own. 1 reads sheets in this process.
+    :return: Dataframe with "Наименование" column followed by a column per date
+    """
+    # Imported on first use, it is needed only to refresh data
+    import openpyxl
+
+    workbook = openpyxl.load_workbook(xlsx_file_path, read_only=True, data_only=True)
+    try:
+        # First sheet is the table of contents
+        sheet_names = workbook.sheetnames[1:]
+        max_workers = min(max_workers, len(sheet_names))
+        if max_workers > 1:
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                years = list(
+                    executor.map(
+                        _read_year_sheet_from_file,
+                        [xlsx_file_path] * len(sheet_names),
+                        sheet_names,
+                    )
+                )
+        else:
+            years = [
+                read_year_sheet(workbook[sheet_name], int(sheet_name))
+                for sheet_name in sheet_names
+            ]
+    finally:
+        workbook.close()
 
     combined_df = pd.concat([df.set_index("Наименование") for df in years], axis=1)
     combined_df.sort_index(inplace=True)
+    return combined_df.reset_index()
+
+
+def xlsx_to_csv(xlsx_file_path: str) -> str:
+    """
+    Turn multiple xlsx sheets into one csv file
+    :param xlsx_file_path: Path to xlsx file
+    :return: Path to converted file
+    """
+    combined_df = xlsx_to_dataframe(xlsx_file_path)
     filename = os.path.join(config.DATA_DIR, "data.csv")
-    combined_df.to_csv(filename)
+    combined_df.to_csv(filename, index=False)
     print(f"Combined data saved successfully to {filename}")
 
     return filename
@@ -79,7 +272,7 @@ def xlsx_to_csv(xlsx_file_path: str) -> str:
 def main():
     data_download_url = config.ROSSTAT_CPI_DATA_URL
 
-    file_path_xlsx = download_data_sheet(data_download_url, config.DATA_DIR)
+    file_path_xlsx, _ = download_data_sheet(data_download_url, config.DATA_DIR)
     file_path_csv = xlsx_to_csv(file_path_xlsx)
 
     print(f"Data downloaded to {file_path_csv}")
@@ -1,17 +1,18 @@
 import os
-import pickle
 import warnings
 from datetime import datetime
-from typing import Any
+from typing import Any, Optional
 
-import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
-from sklearn.metrics import mean_absolute_error
-from statsmodels.stats.stattools import medcouple
-from statsmodels.tsa.holtwinters import ExponentialSmoothing
 
 import config
+from services.forecaster import (
+    HoltWintersForecaster,
+    model_file_path,
+    save_model_artifact,
+)
+from services.process_data.model_selection import DEFAULT_MODEL_SPEC, spec_name
 from services.tools import slugify
 
 
@@ -31,14 +32,17 @@ def split_data(
         raise ValueError("Test coefficient must be between 0 and 1.")
 
     # Calculate the date to split the data
-    total_days = (df["Date"].max() - df["Date"].min()).days
-    split_date = df["Date"].min() + pd.DateOffset(
-        days=int(total_days * (1 - split_coefficient))
+    dates = df["Date"].to_numpy("datetime64[ns]")
+    first_date = dates.min()
+    total_days = int((dates.max() - first_date) // np.timedelta64(1, "D"))
+    split_date = first_date + np.timedelta64(
+        int(total_days * (1 - split_coefficient)), "D"
     )
 
     # Split the data into development and testing sets based on the date
-    dev_data = df[df["Date"] <= split_date]
-    test_data = df[df["Date"] > split_date]
+    is_dev = dates <= split_date
+    dev_data = df[is_dev]
+    test_data = df[~is_dev]
 
     # Verify the split
     print("Development data size:", len(dev_data))  # logger.info
@@ -47,6 +51,27 @@ def split_data(
     return dev_data, test_data
 
 
+def group_by_product(df: pd.DataFrame) -> dict[str, pd.DataFrame]:
+    """
+    Slice long data into data of every product sorted by date.
+    Rows are sorted by product and date once, so data of every product is
+    a contiguous slice of the sorted dataframe.
+
+    :param df: Long dataframe with "Product", "Date" and "Price" columns.
+    :return: Data of every product, products in order of first appearance.
+    """
+    codes, products = pd.factorize(df["Product"])
+    # Dates are whole days, so product and date fit into one integer sort key
+    days = df["Date"].to_numpy("datetime64[D]").astype(np.int64)
+    order = np.argsort((codes.astype(np.int64) << 32) + days, kind="stable")
+    sorted_df = df.take(order)
+    offsets = np.searchsorted(codes[order], np.arange(len(products) + 1))
+    return {
+        product: sorted_df.iloc[offsets[i] : offsets[i + 1]]
+        for i, product in enumerate(products)
+    }
+
+
 def make_forecast(
     product_name: str,
     train_data: pd.DataFrame,
@@ -54,6 +79,9 @@ def make_forecast(
     use_train_test_split: bool = True,
     save_model: bool = False,
     show_plot: bool = False,
+    start_params: Optional[np.ndarray] = None,
+    model_spec: Optional[dict[str, Any]] = None,
+    presorted: bool = False,
 ) -> dict[str, Any]:
     """
     Create 6 months forecast models on provided data.
@@ -62,35 +90,53 @@ def make_forecast(
     :param train_data: Training data dataframe.
     :param test_data: Test data dataframe.
     :param use_train_test_split: Whether to use train and test splits or use whole dataset.
-    :param save_model: Save trained model to .pkl.
+    :param save_model: Save trained model to the models directory.
     :param show_plot: Display forecast plot.
+    :param start_params: Starting values of the optimizer, e.g. parameters of
+        the previous model of the product, see HoltWintersForecaster.start_params.
+    :param model_spec: Trend and seasonality of the model, DEFAULT_MODEL_SPEC by default,
+        see services.process_data.model_selection.
+    :param presorted: Data contains only this product and is sorted by date,
+        e.g. sliced with group_by_product, so it is used as is.
     :return: Dictionary with model and metadata.
     """
+    # Training libraries are imported on first use, so web workers start faster
+    from sklearn.metrics import mean_absolute_error
+    from statsmodels.stats.stattools import medcouple
+    from statsmodels.tsa.holtwinters import ExponentialSmoothing
+
+    if show_plot:
+        import matplotlib.pyplot as plt
 
     # Filter out the specific warnings
     warnings.filterwarnings("ignore", message="No supported index is available.")
     warnings.filterwarnings(
         "ignore", message="An unsupported index was provided and will be"
     )
+    warnings.filterwarnings("ignore", message="Optimization failed to converge.")
+
+    model_spec = model_spec or DEFAULT_MODEL_SPEC
 
     test_mae = train_mae = None
 
-    product_train_data = train_data[train_data["Product"] == product_name]
-    product_test_data = test_data[test_data["Product"] == product_name]
+    if presorted:
+        product_train_data, product_test_data = train_data, test_data
+    else:
+        product_train_data = train_data[train_data["Product"] == product_name]
+        product_test_data = test_data[test_data["Product"] == product_name]
 
-    # Sort the data by date
-    product_train_data = product_train_data.sort_values(by="Date")
-    product_test_data = product_test_data.sort_values(by="Date")
+        # Sort the data by date
+        product_train_data = product_train_data.sort_values(by="Date")
+        product_test_data = product_test_data.sort_values(by="Date")
 
     if use_train_test_split:
         # Use only training data for model fitting
+        # Prices are passed without index, statsmodels supports only date indexes
+        # with frequency
         model = ExponentialSmoothing(
-            product_train_data["Price"],
-            trend="add",
-            seasonal="add",
-            seasonal_periods=12,
+            product_train_data["Price"].to_numpy(np.float64), **model_spec
         )
-        model_fit = model.fit()
+        model_fit = model.fit(start_params=start_params)
 
         # In-sample forecast (on training data)
         in_sample_forecast = model_fit.fittedvalues
@@ -139,9 +185,9 @@ def make_forecast(
             by="Date"
         )
         model = ExponentialSmoothing(
-            combined_data["Price"], trend="add", seasonal="add", seasonal_periods=12
+            combined_data["Price"].to_numpy(np.float64), **model_spec
         )
-        model_fit = model.fit()
+        model_fit = model.fit(start_params=start_params)
 
         # In-sample forecast
         in_sample_forecast = model_fit.fittedvalues
@@ -229,6 +275,7 @@ def make_forecast(
         "model": model_fit,
         "url": f"/forecast/{slugify(product_name)}",
         "product_name": product_name,
+        "model_spec": spec_name(model_spec),
         "train_mae": train_mae if train_mae else None,
         "test_mae": test_mae if test_mae else None,
         "date_created": datetime.now(),
@@ -240,35 +287,56 @@ def make_forecast(
         # "in_sample_dates": [date.strftime('%Y-%m-%d') for date in in_sample_dates],
         "avg_in_sample_ci_width": float(avg_ci_width_in_sample),
         "max_in_sample_ci_width": float(max_ci_width_in_sample),
+        "residual_mse": float(mean_squared_error),
+        "fit_iterations": int(getattr(model_fit.mle_retvals, "nit", 0)),
     }
 
     # Save the model
     if save_model:
-        model_filename = f"{slugify(product_name)}.pkl"
-        model_path = os.path.join(config.MODELS_DIR, model_filename)
-        with open(model_path, "wb") as f:
-            pickle.dump(model_metadata, f)
+        save_model_dict(model_metadata)
 
     return model_metadata
 
 
+def save_model_dict(model_metadata: dict[str, Any]) -> str:
+    """
+    Save model with its metadata to compact artifact in the models directory.
+
+    :param model_metadata: Dictionary returned by make_forecast.
+        Model may be either HoltWintersResults or HoltWintersForecaster.
+    :return: Path to saved model file.
+    """
+    model = model_metadata["model"]
+    if not isinstance(model, HoltWintersForecaster):
+        model_metadata = {
+            **model_metadata,
+            "model": HoltWintersForecaster.from_results(model),
+        }
+    model_path = model_file_path(
+        config.MODELS_DIR, slugify(model_metadata["product_name"])
+    )
+    save_model_artifact(model_path, model_metadata)
+    return model_path
+
+
 def main():
     file_name = os.path.join(config.DATA_DIR, "train_data.csv")
     df = pd.read_csv(
         file_name, index_col=0, dtype={"Price": float}, parse_dates=["Date"]
     )
     dev_data, test_data = split_data(df, 0.15)
-    products = dev_data["Product"].unique()
+    test_groups = group_by_product(test_data)
 
-    for product in products:
+    for product, product_dev in group_by_product(dev_data).items():
         print(f"Creating model for product {product}")  # logger.info
         make_forecast(
             product,
-            dev_data,
-            test_data,
+            product_dev,
+            test_groups.get(product, test_data.iloc[0:0]),
             use_train_test_split=True,
             save_model=True,
             show_plot=False,
+            presorted=True,
         )
 
 
@@ -0,0 +1,81 @@
+from typing import Any
+
+import numpy as np
+import pandas as pd
+
+from services.data_store import ProductData
+
+# Dates are stored as days since epoch in the low bits of row keys
+_DAY_BITS = 32
+
+
+def _row_keys(codes: np.ndarray, dates: np.ndarray) -> np.ndarray:
+    days = dates.astype("datetime64[D]").astype(np.int64)
+    return (codes.astype(np.int64) << _DAY_BITS) + days
+
+
+def merge_price_data(
+    stored: ProductData, df_long: pd.DataFrame
+) -> tuple[pd.DataFrame, dict[str, Any]]:
+    """
+    Merge freshly cleaned data into the stored dataset.
+    Only rows of the new data which are missing in the stored dataset or have
+    a different price are applied, rows missing in the new data are kept.
+
+    :param stored: Stored dataset, see services.data_store.
+    :param df_long: Long dataframe with "Product", "Date" and "Price" columns.
+    :return: Merged long dataframe and a report of changes: numbers of added and
+        updated rows, new products, new dates and names of all changed products.
+    """
+    product_codes = {product: i for i, product in enumerate(stored.products)}
+    codes = df_long["Product"].map(product_codes).fillna(-1).to_numpy(np.int64)
+    dates = df_long["Date"].to_numpy("datetime64[ns]")
+    prices = df_long["Price"].to_numpy(np.float64)
+
+    # Stored rows are sorted by product and date, so their keys are sorted too
+    stored_keys = _row_keys(stored.product_codes, stored.dates)
+    keys = _row_keys(codes, dates)
+    positions = np.searchsorted(stored_keys, keys)
+    found = (codes >= 0) & (positions < len(stored_keys))
+    found[found] = stored_keys[positions[found]] == keys[found]
+
+    is_new = ~found
+    is_updated = found.copy()
+    is_updated[found] = stored.prices[positions[found]] != prices[found]
+
+    merged_prices = np.array(stored.prices)
+    merged_prices[positions[is_updated]] = prices[is_updated]
+    merged = pd.concat(
+        [
+            pd.DataFrame(
+                {
+                    "Product": np.repeat(
+                        np.array(stored.products, dtype=object),
+                        np.diff(stored.offsets),
+                    ),
+                    "Date": stored.dates,
+                    "Price": merged_prices,
+                }
+            ),
+            df_long.loc[is_new, ["Product", "Date", "Price"]],
+        ],
+        ignore_index=True,
+    )
+
+    changed = df_long["Product"][is_new | is_updated].unique()
+    changes = {
+        "added_rows": int(is_new.sum()),
+        "updated_rows": int(is_updated.sum()),
+        "new_products": [
+            str(product) for product in df_long["Product"][codes < 0].unique()
+        ],
+        "new_dates": [
+            str(day)
+            for day in np.setdiff1d(
+                dates[is_new].astype("datetime64[D]"),
+                stored.dates.astype("datetime64[D]"),
+            )
+        ],
+        "changed_products": [str(product) for product in changed],
+    }
+    return merged, changes
@@ -0,0 +1,263 @@
+import math
+from typing import Any, Optional
+
+import numpy as np
+
+import config
+from services.forecaster import HoltWintersForecaster
+
+# Model used for every product before model selection and when it is disabled
+DEFAULT_MODEL_SPEC = {
+    "trend": "add",
+    "damped_trend": False,
+    "seasonal": "add",
+    "seasonal_periods": 12,
+}
+
+# Seasonality is selected first: every seasonality is fitted with additive trend,
+# then other trends are fitted only with seasonalities which are not pruned.
+# The default seasonality is fitted first, the others from the cheapest one:
+# on 5 years of weekly data fits without seasonality take about 0.3, with 4 weeks
+# 0.85 and with 52 weeks 2 times as long as the default one
+SEASONALITIES = [("add", 12), (None, None), ("add", 4), ("add", 52)]
+TRENDS = [("add", False), ("mul", False), ("add", True)]
+
+
+def model_spec(
+    trend: Optional[str],
+    damped_trend: bool,
+    seasonal: Optional[str],
+    seasonal_periods: Optional[int],
+) -> dict[str, Any]:
+    """
+    Keyword arguments of ExponentialSmoothing describing a candidate model.
+    """
+    return {
+        "trend": trend,
+        "damped_trend": damped_trend,
+        "seasonal": seasonal,
+        "seasonal_periods": seasonal_periods if seasonal else None,
+    }
+
+
+def spec_name(spec: dict[str, Any]) -> str:
+    """
+    Short name of a model spec, e.g. "add_damped-add12" or "mul-none".
+    """
+    trend = spec["trend"] or "none"
+    if spec["damped_trend"]:
+        trend += "_damped"
+    seasonal = spec["seasonal"] or "none"
+    if spec["seasonal"]:
+        seasonal += str(spec["seasonal_periods"])
+    return f"{trend}-{seasonal}"
+
+
+def spec_of_model(model: HoltWintersForecaster) -> dict[str, Any]:
+    """
+    Spec of a saved model, to find the candidate its parameters can warm-start.
+    """
+    return model_spec(
+        model.trend,
+        model.damped,
+        model.seasonal,
+        model.seasonal_periods if model.seasonal else None,
+    )
+
+
+def is_feasible(spec: dict[str, Any], train_prices: np.ndarray) -> bool:
+    """
+    Whether a candidate can be fitted on the training data of a product.
+    Seasonal components are initialized from two full seasonal cycles and
+    multiplicative trend needs positive prices.
+    """
+    if spec["seasonal"] and len(train_prices) < 2 * spec["seasonal_periods"]:
+        return False
+    if "mul" in (spec["trend"], spec["seasonal"]) and not np.all(train_prices > 0):
+        return False
+    return True
+
+
+class ModelSelection:
+    """
+    Selection of the model of one product among candidates in two stages.
+    Candidates are scored by MAE on the test part of the data and the one with
+    the lowest score wins, ties go to the candidate fitted first.
+
+    In the first stage every seasonality is fitted with additive trend, the
+    default model first. In the second one other trends are fitted for
+    seasonalities whose score is within prune_ratio of the best one, the most
+    promising first.
+
+    Candidates are fitted one at a time and both stages share one deadline:
+    budget times the duration of the first successful fit. A candidate is skipped
+    when it is expected to end after the deadline, its duration is estimated by
+    the fit with the same seasonality, or the first one for seasonalities not
+    fitted yet.
+    """
+
+    def __init__(
+        self,
+        train_prices: np.ndarray,
+        search: bool = True,
+        budget: Optional[float] = None,
+        prune_ratio: Optional[float] = None,
+        previous_spec: Optional[dict[str, Any]] = None,
+        start_params: Optional[np.ndarray] = None,
+        spec: Optional[dict[str, Any]] = None,
+    ):
+        """
+        :param train_prices: Training prices of the product.
+        :param search: Whether to search candidates or fit only spec.
+        :param budget: Time of all fits as a multiple of the first successful one,
+            MODEL_SELECTION_BUDGET by default.
+        :param prune_ratio: MODEL_SELECTION_PRUNE_RATIO by default.
+        :param previous_spec: Spec of the previous model of the product.
+        :param start_params: Parameters of the previous model, used to warm-start
+            the candidate with the same spec.
+        :param spec: Model fitted without search, DEFAULT_MODEL_SPEC by default.
+        """
+        self.train_prices = train_prices
+        self.search = search
+        self.budget = config.MODEL_SELECTION_BUDGET if budget is None else budget
+        self.prune_ratio = (
+            config.MODEL_SELECTION_PRUNE_RATIO if prune_ratio is None else prune_ratio
+        )
+        self.previous_name = spec_name(previous_spec) if previous_spec else None
+        self._start_params = start_params
+        self.spec = spec or DEFAULT_MODEL_SPEC
+
+        self.scores: dict[str, Optional[float]] = {}
+        self.errors: dict[str, str] = {}
+        self.elapsed = 0.0
+        self.pending = 0
+        self.pruned: list[str] = []
+        self.over_budget: list[str] = []
+        self.deadline: Optional[float] = None
+        self._first_time: Optional[float] = None
+        self._times: dict[str, float] = {}
+        self._best: Optional[dict[str, Any]] = None
+        self._stage = 0
+        self._queue: list[dict[str, Any]] = []
+
+    def start_params(self, spec: dict[str, Any]) -> Optional[np.ndarray]:
+        """
+        Warm-start parameters for a candidate, only the previous spec has them.
+        """
+        if spec_name(spec) == self.previous_name:
+            return self._start_params
+        return None
+
+    def next_candidates(self) -> list[dict[str, Any]]:
+        """
+        Next candidate to fit, one at a time. Empty while a result is pending
+        and once the selection is finished.
+        """
+        if self.pending:
+            return []
+        while True:
+            while self._queue:
+                spec = self._queue.pop(0)
+                if self._within_budget(spec):
+                    self.pending += 1
+                    return [spec]
+                self.over_budget.append(spec_name(spec))
+            if self._stage == 2:
+                return []
+            self._stage += 1
+            if self._stage == 1:
+                self._queue = self._first_stage()
+            elif self.search:
+                self._queue = self._second_stage()
+
+    def _within_budget(self, spec: dict[str, Any]) -> bool:
+        if self.deadline is None:
+            return True
+        head = spec_name(
+            model_spec("add", False, spec["seasonal"], spec["seasonal_periods"])
+        )
+        expected = self._times.get(head, self._first_time)
+        return self.elapsed + expected <= self.deadline
+
+    def _first_stage(self) -> list[dict[str, Any]]:
+        if not self.search:
+            return [self.spec]
+        candidates = [
+            model_spec("add", False, seasonal, seasonal_periods)
+            for seasonal, seasonal_periods in SEASONALITIES
+        ]
+        return [spec for spec in candidates if is_feasible(spec, self.train_prices)]
+
+    def _second_stage(self) -> list[dict[str, Any]]:
+        heads = []
+        for seasonality in SEASONALITIES:
+            head = spec_name(model_spec("add", False, *seasonality))
+            if self.scores.get(head) is not None:
+                heads.append((self.scores[head], head, seasonality))
+        if not heads:
+            return []
+        best_score = min(score for score, _, _ in heads)
+
+        candidates = []
+        for score, head, seasonality in sorted(heads, key=lambda item: item[0]):
+            for trend, damped_trend in TRENDS[1:]:
+                spec = model_spec(trend, damped_trend, *seasonality)
+                if not is_feasible(spec, self.train_prices):
+                    continue
+                if score > best_score * self.prune_ratio:
+                    self.pruned.append(spec_name(spec))
+                    continue
+                candidates.append(spec)
+        return candidates
+
+    def add_result(
+        self,
+        spec: dict[str, Any],
+        model_metadata: Optional[dict[str, Any]],
+        error: Optional[str],
+        elapsed: float,
+    ) -> None:
+        """
+        Record result of a candidate fit, see train_models.train_product.
+        """
+        name = spec_name(spec)
+        self.pending -= 1
+        self.elapsed += elapsed
+        self._times[name] = elapsed
+
+        score = None
+        if error is None:
+            score = model_metadata["test_mae"]
+            if score is None or not math.isfinite(score):
+                error = f"Test MAE is {score}"
+                score = None
+        self.scores[name] = score
+        if error is None and self.deadline is None:
+            self._first_time = elapsed
+            self.deadline = self.budget * elapsed
+        if error is not None:
+            self.errors[name] = error
+            return
+        if self._best is None or score < self._best["test_mae"]:
+            self._best = model_metadata
+
+    def best(self) -> Optional[dict[str, Any]]:
+        """
+        Metadata of the selected model with its score and scores of all
+        candidates, None if no candidate could be fitted.
+        """
+        if self._best is None:
+            return None
+        return {
+            **self._best,
+            "selection_score": self._best["test_mae"],
+            "candidate_scores": dict(self.scores),
+        }
+
+    def error(self) -> str:
+        """
+        Error of the first failed candidate, for products without a model.
+        """
+        if not self.errors:
+            return "No feasible model candidates"
+        return next(iter(self.errors.values()))
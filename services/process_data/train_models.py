@@ -0,0 +1,296 @@
+import hashlib
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Any, Callable, Optional
+
+import numpy as np
+import pandas as pd
+
+import config
+from services.forecaster import (
+    HoltWintersForecaster,
+    load_model_artifact,
+    model_file_path,
+)
+from services.process_data.generate_models import (
+    group_by_product,
+    make_forecast,
+    save_model_dict,
+)
+from services.process_data.model_selection import (
+    DEFAULT_MODEL_SPEC,
+    ModelSelection,
+    spec_of_model,
+)
+from services.tools import slugify
+
+# Change when training changes, so models trained before are not reused
+TRAINING_VERSION = 2
+
+
+def series_fingerprint(train_data: pd.DataFrame, test_data: pd.DataFrame) -> str:
+    """
+    Hash of the data a model of a product is trained on and of model selection
+    settings, so changing them retrains products with unchanged data.
+
+    :param train_data: Training data of the product, sorted by date.
+    :param test_data: Test data of the product, sorted by date.
+    """
+    settings = (
+        f"{TRAINING_VERSION}:{config.MODEL_SELECTION}:"
+        f"{config.MODEL_SELECTION_BUDGET}:{config.MODEL_SELECTION_PRUNE_RATIO}"
+    )
+    digest = hashlib.sha256(settings.encode())
+    for data in (train_data, test_data):
+        digest.update(len(data).to_bytes(8, "little"))
+        digest.update(data["Date"].to_numpy("datetime64[ns]").tobytes())
+        digest.update(data["Price"].to_numpy(np.float64).tobytes())
+    return digest.hexdigest()
+
+
+def _import_training_libraries() -> None:
+    """
+    Import libraries used by make_forecast, so the first fit of a process is not
+    slowed down by imports. Its duration sets the model selection deadline.
+    """
+    from sklearn.metrics import mean_absolute_error  # noqa: F401
+    from statsmodels.tsa.holtwinters import ExponentialSmoothing  # noqa: F401
+
+
+def _load_previous_model(product_name: str) -> Optional[dict[str, Any]]:
+    path = model_file_path(config.MODELS_DIR, slugify(product_name))
+    if not os.path.isfile(path):
+        return None
+    try:
+        return load_model_artifact(path)
+    except Exception as e:
+        print(f"Previous model of {product_name} is not readable: {e}")  # logger.error
+        return None
+
+
+def train_product(
+    product_name: str,
+    train_data: pd.DataFrame,
+    test_data: pd.DataFrame,
+    start_params: Optional[np.ndarray] = None,
+    model_spec: Optional[dict[str, Any]] = None,
+) -> tuple[str, Optional[dict[str, Any]], Optional[str], float]:
+    """
+    Train model for a single product. Runs inside a pool worker, so any error is
+    caught and returned instead of raised to keep other products unaffected.
+
+    :param product_name: Name of the product in "Product" column.
+    :param train_data: Training data of this product sorted by date.
+    :param test_data: Test data of this product sorted by date.
+    :param start_params: Parameters of the previous model to warm-start the fit from.
+        If the warm-started fit fails, the model is fitted from scratch.
+    :param model_spec: Trend and seasonality of the model, see make_forecast.
+    :return: Product name, model metadata (None on failure), error message and time spent.
+    """
+    start = time.perf_counter()
+    try:
+        try:
+            model_metadata = make_forecast(
+                product_name,
+                train_data,
+                test_data,
+                use_train_test_split=True,
+                save_model=False,
+                show_plot=False,
+                start_params=start_params,
+                model_spec=model_spec,
+                presorted=True,
+            )
+        except Exception:
+            if start_params is None:
+                raise
+            model_metadata = make_forecast(
+                product_name,
+                train_data,
+                test_data,
+                use_train_test_split=True,
+                save_model=False,
+                show_plot=False,
+                model_spec=model_spec,
+                presorted=True,
+            )
+        # Send back only the states needed for forecasting, not the whole results
+        model_metadata["model"] = HoltWintersForecaster.from_results(
+            model_metadata["model"]
+        )
+    except Exception as e:
+        return (
+            product_name,
+            None,
+            f"{type(e).__name__}: {e}",
+            time.perf_counter() - start,
+        )
+    return product_name, model_metadata, None, time.perf_counter() - start
+
+
+def train_models(
+    dev_data: pd.DataFrame,
+    test_data: pd.DataFrame,
+    max_workers: Optional[int] = None,
+    progress: Optional[Callable] = None,
+    incremental: bool = False,
+) -> dict[str, Any]:
+    """
+    Select and train models for all products in parallel and save them as
+    selections finish. Model candidates of all products are fitted in one pool,
+    see services.process_data.model_selection. Every model is saved with the
+    fingerprint of its data, see series_fingerprint.
+
+    :param dev_data: Development data for all products.
+    :param test_data: Test data for all products.
+    :param max_workers: Number of worker processes, by default TRAINING_WORKERS from config.py.
+        With 1 worker models are trained in the current process.
+    :param progress: Optional callback progress(stage, done, total), see services.jobs.
+    :param incremental: Skip products whose data did not change since their model
+        was trained. Changed products are refitted with the previous kind of model
+        warm-started from its parameters, without model selection, which is left
+        to full retrains. With MODEL_SELECTION disabled they get the default model.
+    :return: Summary with succeeded, failed and skipped products, number of fitted
+        candidates, selected kinds of models and timings in seconds.
+    """
+    max_workers = max_workers or config.TRAINING_WORKERS
+
+    # Slice data per product once, so workers receive only their own rows
+    dev_groups = group_by_product(dev_data)
+    test_groups = group_by_product(test_data)
+    empty_test = test_data.iloc[0:0]
+
+    fingerprints = {}
+    skipped, warm_started = [], []
+    selections: dict[str, ModelSelection] = {}
+    for product, product_dev in dev_groups.items():
+        product_test = test_groups.get(product, empty_test)
+        fingerprints[product] = series_fingerprint(product_dev, product_test)
+        previous = _load_previous_model(product) if incremental else None
+        if previous is None:
+            selections[product] = ModelSelection(
+                product_dev["Price"].to_numpy(np.float64),
+                search=config.MODEL_SELECTION,
+            )
+            continue
+        if previous.get("fingerprint") == fingerprints[product]:
+            skipped.append(product)
+            continue
+        previous_spec = spec_of_model(previous["model"])
+        spec = previous_spec if config.MODEL_SELECTION else DEFAULT_MODEL_SPEC
+        selections[product] = ModelSelection(
+            product_dev["Price"].to_numpy(np.float64),
+            search=False,
+            previous_spec=previous_spec,
+            start_params=previous["model"].start_params(),
+            spec=spec,
+        )
+        if spec == previous_spec:
+            warm_started.append(product)
+
+    summary = {
+        "total": len(selections),
+        "succeeded": [],
+        "failed": {},
+        "timings": {},
+        "workers": max_workers,
+        "skipped": skipped,
+        "warm_started": warm_started,
+        "candidates_fitted": 0,
+        "models": {},
+    }
+    start = time.perf_counter()
+    if progress:
+        progress("training", 0, len(selections))
+
+    def fit_args(product, spec):
+        return (
+            product,
+            dev_groups[product],
+            test_groups.get(product, empty_test),
+            selections[product].start_params(spec),
+            spec,
+        )
+
+    def collect(product_name):
+        selection = selections[product_name]
+        summary["timings"][product_name] = selection.elapsed
+        summary["candidates_fitted"] += len(selection.scores)
+        model_metadata = selection.best()
+        error = selection.error() if model_metadata is None else None
+        if error is None:
+            try:
+                model_metadata["fingerprint"] = fingerprints[product_name]
+                save_model_dict(model_metadata)
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+        if error is None:
+            summary["succeeded"].append(product_name)
+            kind = model_metadata["model_spec"]
+            summary["models"][kind] = summary["models"].get(kind, 0) + 1
+            print(
+                f"Model {kind} for {product_name} selected among "
+                f"{len(selection.scores)} in {selection.elapsed:.2f}s"
+            )  # logger.info
+        else:
+            summary["failed"][product_name] = error
+            print(f"Model for {product_name} failed: {error}")  # logger.error
+        if progress:
+            progress("training", len(summary["timings"]), len(selections))
+
+    if max_workers == 1:
+        _import_training_libraries()
+        for product, selection in selections.items():
+            candidates = selection.next_candidates()
+            while candidates:
+                for spec in candidates:
+                    selection.add_result(
+                        spec, *train_product(*fit_args(product, spec))[1:]
+                    )
+                candidates = selection.next_candidates()
+            collect(product)
+    else:
+        with ProcessPoolExecutor(
+            max_workers=max_workers, initializer=_import_training_libraries
+        ) as executor:
+            futures = {}
+
+            def submit(product):
+                selection = selections[product]
+                for spec in selection.next_candidates():
+                    try:
+                        future = executor.submit(
+                            train_product, *fit_args(product, spec)
+                        )
+                    except Exception as e:
+                        # Pool is broken by a dead worker process
+                        selection.add_result(
+                            spec, None, f"{type(e).__name__}: {e}", 0.0
+                        )
+                        continue
+                    futures[future] = (product, spec)
+                if not selection.pending:
+                    collect(product)
+
+            for product in selections:
+                submit(product)
+            while futures:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    product, spec = futures.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        # Worker process died, e.g. killed by OOM
+                        result = (product, None, f"{type(e).__name__}: {e}", 0.0)
+                    selections[product].add_result(spec, *result[1:])
+                    submit(product)
+
+    summary["elapsed"] = time.perf_counter() - start
+    print(
+        f"Trained {len(summary['succeeded'])}/{summary['total']} models "
+        f"in {summary['elapsed']:.2f}s, failed: {len(summary['failed'])}, "
+        f"unchanged: {len(skipped)}, candidates fitted: {summary['candidates_fitted']}"
+    )  # logger.info
+    return summary
@@ -1,108 +1,119 @@
 import glob
 import os
 import re
+import shutil
 import stat
+import threading
 from datetime import date, datetime
+from functools import lru_cache
+from typing import BinaryIO, Callable, Optional, Union
 
 import pandas as pd
 
 import config
 
-
+MONTH_MAPPING = {
+    "января": 1,
+    "февраля": 2,
+    "марта": 3,
+    "апреля": 4,
+    "мая": 5,
+    "июня": 6,
+    "июля": 7,
+    "августа": 8,
+    "сентября": 9,
+    "октября": 10,
+    "ноября": 11,
+    "декабря": 12,
+}
+
+
+@lru_cache(maxsize=4096)
 def parse_dates(date_str: str, year: int) -> date:
     """
     Parse date string in format YYYY-MM-DD from vintage's column title
     Each vintage have a date in format like 'на 16 января'
+    Headers repeat across sheets and refreshes, so parsed dates are cached.
     """
 
     # Clean string
     date_str = date_str.replace("*", "").lstrip("на ")
 
-    month_mapping = {
-        "января": 1,
-        "февраля": 2,
-        "марта": 3,
-        "апреля": 4,
-        "мая": 5,
-        "июня": 6,
-        "июля": 7,
-        "августа": 8,
-        "сентября": 9,
-        "октября": 10,
-        "ноября": 11,
-        "декабря": 12,
-    }
-
     parts = date_str.split()
     day = int(parts[0])
     month_name = parts[1]
 
-    month = month_mapping[month_name]
+    month = MONTH_MAPPING[month_name]
 
     date_obj = datetime(year, month, day).date()
 
     return date_obj
 
 
+# Слоаврь с заменами
+TRANSLITERATION = {
+    "а": "a",
+    "б": "b",
+    "в": "v",
+    "г": "g",
+    "д": "d",
+    "е": "e",
+    "ё": "e",
+    "ж": "zh",
+    "з": "z",
+    "и": "i",
+    "й": "i",
+    "к": "k",
+    "л": "l",
+    "м": "m",
+    "н": "n",
+    "о": "o",
+    "п": "p",
+    "р": "r",
+    "с": "s",
+    "т": "t",
+    "у": "u",
+    "ф": "f",
+    "х": "h",
+    "ц": "c",
+    "ч": "cz",
+    "ш": "sh",
+    "щ": "scz",
+    "ъ": "",
+    "ы": "y",
+    "ь": "b",
+    "э": "e",
+    "ю": "u",
+    "я": "ja",
+}
+_TRANSLITERATION_TABLE = str.maketrans(TRANSLITERATION)
+
+_NON_WORD_RE = re.compile(r"[^\w\s-]")
+_SEPARATORS_RE = re.compile(r"[-\s]+")
+
+
 def transliterate(name):
     """
     Автор: LarsKort
     Дата: 16/07/2011; 1:05 GMT-4;
     https://gist.github.com/ledovsky/6398962
     """
-    # Слоаврь с заменами
-    dictionary = {
-        "а": "a",
-        "б": "b",
-        "в": "v",
-        "г": "g",
-        "д": "d",
-        "е": "e",
-        "ё": "e",
-        "ж": "zh",
-        "з": "z",
-        "и": "i",
-        "й": "i",
-        "к": "k",
-        "л": "l",
-        "м": "m",
-        "н": "n",
-        "о": "o",
-        "п": "p",
-        "р": "r",
-        "с": "s",
-        "т": "t",
-        "у": "u",
-        "ф": "f",
-        "х": "h",
-        "ц": "c",
-        "ч": "cz",
-        "ш": "sh",
-        "щ": "scz",
-        "ъ": "",
-        "ы": "y",
-        "ь": "b",
-        "э": "e",
-        "ю": "u",
-        "я": "ja",
-    }
-
-    # Циклически заменяем все буквы в строке
-    for key in dictionary:
-        name = name.replace(key, dictionary[key])
-    return name
+    # Заменяем все буквы в строке за один проход
+    return name.translate(_TRANSLITERATION_TABLE)
 
 
+@lru_cache(maxsize=4096)
 def slugify(word: str) -> str:
     """
     Converts to lowercase, removes non-word characters (alphanumerics and underscores)
     and converts spaces to hyphens. Also strips leading and trailing whitespace.
+    Product names repeat, so slugs are cached.
 
     :param word: Cyrillic word string
     """
     word = transliterate(word.lower())
-    word = re.sub(r"[^\w\s-]", "", word).strip()
-    word = re.sub(r"[-\s]+", "-", word)
+    word = _NON_WORD_RE.sub("", word).strip()
+    word = _SEPARATORS_RE.sub("-", word)
     return word
 
 
@@ -166,26 +177,92 @@ def print_full_df(df: pd.DataFrame) -> None:
 
 def check_models_availability() -> bool:
     """
-    Check if the CSV file exists and is readable, and if there are .pkl files in the models directory.
+    Check if the data file exists and is readable, and if there are model files in the models directory.
 
     :return: True if both conditions are met, False otherwise
     """
-    # Check if the CSV file exists and is readable
-    data_file_exists = os.path.isfile(config.DATA_FILE_PATH) and os.access(
-        config.DATA_FILE_PATH, os.R_OK
+    # Check if the data file exists and is readable
+    data_file_exists = os.path.isfile(config.DATA_COLUMNS_PATH) and os.access(
+        config.DATA_COLUMNS_PATH, os.R_OK
     )
 
-    # Check if there are .pkl files in the models directory
-    model_files = glob.glob(os.path.join(config.MODELS_DIR, "*.pkl"))
+    # Check if there are model files in the models directory
+    model_files = glob.glob(
+        os.path.join(config.MODELS_DIR, f"*{config.MODEL_FILE_EXTENSION}")
+    )
     models_available = len(model_files) > 0
 
     return data_file_exists and models_available
 
 
+def process_start_time(pid: int) -> Optional[int]:
+    """
+    Start time of a process in clock ticks since boot, from /proc/<pid>/stat.
+    Together with the pid it identifies the process, pids are reused e.g. by
+    workers of a restarted container.
+
+    :return: Start time or None if the process does not exist or there is no /proc.
+    """
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            stat = f.read()
+    except OSError:
+        return None
+    # Fields after the command name, which is in parentheses and may contain spaces,
+    # the start time is the 22nd field of the line
+    return int(stat.rpartition(")")[2].split()[19])
+
+
+def is_process_alive(pid: int, start_time: Optional[int] = None) -> bool:
+    """
+    Check if a process with the given pid is running, e.g. the one owning a job.
+
+    :param pid: Process id.
+    :param start_time: Start time of the process, see process_start_time. If given,
+        another process which got the same pid is not counted.
+    """
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # The process exists, but belongs to another user
+        pass
+    if start_time is None:
+        return True
+    current_start_time = process_start_time(pid)
+    return current_start_time is None or current_start_time == start_time
+
+
+def atomic_write(
+    path: str, data: Union[str, bytes, Callable[[BinaryIO], None]]
+) -> None:
+    """
+    Write a file to a temporary path next to it and rename it into place, so
+    readers in other threads and worker processes never see a partial file.
+
+    :param path: Path to the file.
+    :param data: Content of the file, or a function writing it to the binary file
+        object passed to it, for files which are not built in memory.
+    """
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            if callable(data):
+                data(f)
+            else:
+                f.write(data.encode() if isinstance(data, str) else data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
 def delete_files_in_directory(directory: str):
     for filename in os.listdir(directory):
         file_path = os.path.join(directory, filename)
         if os.path.isfile(file_path) or os.path.islink(file_path):
             os.unlink(file_path)
         elif os.path.isdir(file_path):
-            os.rmdir(file_path)
+            shutil.rmtree(file_path)
@@ -110,12 +110,49 @@ function fetchModels(type) {
 
 function handleResponse(data) {
     if (data.success === true) {
-        window.location.href = '/plot';
+        // Models are created in a background job, wait for it to finish
+        return waitForJob(data.status_url);
     } else {
         handleError(data.error);
     }
 }
 
+function waitForJob(statusUrl) {
+    return new Promise((resolve, reject) => {
+        const poll = () => {
+            fetch(statusUrl)
+                .then(response => response.json())
+                .then(job => {
+                    if (job.status === 'succeeded') {
+                        resolve();
+                        window.location.href = '/plot';
+                    } else if (job.status === 'failed' || job.success === false) {
+                        reject(job.error);
+                    } else {
+                        showJobProgress(job);
+                        setTimeout(poll, 2000);
+                    }
+                })
+                .catch(reject);
+        };
+        poll();
+    });
+}
+
+function showJobProgress(job) {
+    const message_box = document.getElementById('message-placeholder');
+    let text = `Stage: ${job.stage}`;
+    if (job.progress.total) {
+        text += ` (${job.progress.done}/${job.progress.total})`;
+    }
+    if (job.eta_seconds !== null) {
+        text += `, about ${Math.ceil(job.eta_seconds)} sec left`;
+    }
+    message_box.style.display = 'block';
+    message_box.className = 'message info';
+    message_box.textContent = text;
+}
+
 function handleError(error) {
     const message_box = document.getElementById('message-placeholder');
     message_box.style.display = 'block';